@@ -0,0 +1,42 @@
+import functools
+import importlib
+import os
+
+from typing import List
+
+from engine.unit_player import UnitPlayerBase
+
+
+BRAINS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@functools.lru_cache(maxsize=None)
+def load_unit_player_class(name: str) -> UnitPlayerBase:
+    """
+    Imports the UnitPlayer class of the brain in brains/<name>/unit_player.py.
+    """
+    return importlib.import_module(f"{__name__}.{name}.unit_player").UnitPlayer
+
+
+@functools.lru_cache(maxsize=None)
+def load_player(spec: str) -> UnitPlayerBase:
+    """
+    Returns the UnitPlayer class of a player given as "<brain>" or
+    "<brain>:<net file>". The second form is a subclass of the brain's
+    UnitPlayer that plays the saved net, like "brain:models/best_net_10.npy".
+    """
+    name, _, net_file = spec.partition(":")
+    unit_player_class = load_unit_player_class(name)
+
+    if not net_file:
+        return unit_player_class
+
+    return type(unit_player_class.__name__, (unit_player_class,), {"NET_FILE": net_file})
+
+
+def list_brains() -> List[str]:
+    """
+    Returns the names of the brains in this folder, sorted.
+    """
+    return sorted(name for name in os.listdir(BRAINS_DIR)
+                  if os.path.isfile(os.path.join(BRAINS_DIR, name, "unit_player.py")))
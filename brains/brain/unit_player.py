@@ -1,15 +1,120 @@
+import functools
+import weakref
+
 import numpy as np
 
+from typing import Dict, List
+
 from engine.direction import Direction
-from engine.location import Location
 from engine.team import Team
 from engine.unit_controller import UnitController
 from engine.unit_player import UnitPlayerBase
-from reinforcement.genetic_manager import GeneticManager
-from reinforcement.net import Net
+from engine.unit_types.unit_type import UnitType
+from genetics.genetic_manager import GeneticManager
+from genetics.net import Net
+
+
+INPUT_RADIUS = 5
+
+
+@functools.lru_cache(maxsize=None)
+def input_stencil(unit_type: UnitType) -> np.ndarray:
+    """
+    Vision offsets fed to the net: the vision disc clipped to
+    the (2 * INPUT_RADIUS + 1)^2 box around the unit.
+    """
+    stencil = unit_type.vision_stencil()
+    return stencil[(np.abs(stencil) <= INPUT_RADIUS).all(axis=1)]
+
+
+@functools.lru_cache(maxsize=None)
+def load_net(file_path: str) -> Net:
+    """
+    Loads a saved net once and shares it between the units that use it.
+    The size of the hidden layer is read from the file.
+    """
+    hidden_nodes = np.load(file_path, allow_pickle=True)[0].shape[0]
+    net = Net(**{
+        'input_nodes': 118,
+        'hidden_nodes': hidden_nodes,
+        'output_nodes': 9,
+    })
+    net.load(file_path)
+    return net
+
+
+class TeamInference:
+    """
+    Runs the net once per turn for all the units of a team that play it,
+    the first time one of them asks for its move.
+    """
+
+    def __init__(self):
+        self.turn = None
+        self.unit_players = None
+        self.net = None
+        self.directions: Dict[int, int] = {}
+
+    def get_direction(self, unit_player: 'UnitPlayer') -> int:
+        unit = unit_player.uc.unit
+        world_manager = unit.world_manager
+
+        # The unit players dict is replaced when the game is reset or restored.
+        if (self.turn != world_manager.turn or self.unit_players is not world_manager.unit_players
+                or self.net is not unit_player.net or unit.id not in self.directions):
+            self.run(unit_player)
+            self.turn = world_manager.turn
+            self.unit_players = world_manager.unit_players
+            self.net = unit_player.net
+
+        return self.directions[unit.id]
+
+    def run(self, caller: 'UnitPlayer'):
+        world = caller.uc.unit.world
+        players: List[UnitPlayer] = [
+            unit_player for unit_player in caller.uc.unit.world_manager.unit_players.values()
+            if isinstance(unit_player, UnitPlayer) and unit_player.net is caller.net
+            and unit_player.uc.unit.team == caller.uc.unit.team and unit_player.uc.unit.is_alive()]
+        units = [unit_player.uc.unit for unit_player in players]
+
+        # Sense the world
+        stencil = input_stencil(caller.uc.unit.unit_type)
+        xs = np.array([unit.location.x for unit in units])[:, np.newaxis] + stencil[:, 0]
+        ys = np.array([unit.location.y for unit in units])[:, np.newaxis] + stencil[:, 1]
+        inside = (xs >= 0) & (xs < world.width) & (ys >= 0) & (ys < world.height)
+        unit_ids = np.zeros(xs.shape, dtype=np.int32)
+        unit_ids[inside] = world.occupancy[xs[inside], ys[inside]]
+
+        # Value of each unit id as seen by an ally, and as seen by an enemy.
+        ally_values = np.zeros(max(world.units_by_id, default=0) + 1)
+        enemy_values = np.zeros_like(ally_values)
+        teams = np.full(len(ally_values), -1)
+
+        for unit in world.units_by_id.values():
+            ally_values[unit.id] = unit.health / unit.max_health + 1
+            enemy_values[unit.id] = -unit.health / unit.max_health
+            teams[unit.id] = unit.team.value
+
+        # Prepare net inputs
+        inputs = np.empty((len(units), len(stencil) + 1))
+        inputs[:, 0] = [unit.health / unit.max_health for unit in units]
+        inputs[:, 1:] = np.where(teams[unit_ids] == caller.uc.unit.team.value,
+                                 ally_values[unit_ids], enemy_values[unit_ids])
+        inputs[:, 1:][unit_ids == 0] = 0
+
+        # Run the net and choose the best direction of every unit
+        best_directions = np.argmax(caller.net.forward_batch(inputs), axis=1)
+        self.directions = dict(zip([unit.id for unit in units], best_directions.tolist()))
+
+
+# One TeamInference per game, dropped along with the game.
+team_inferences: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
 
 
 class UnitPlayer(UnitPlayerBase):
+    # Net played when there is no genetic manager, see brains.load_player.
+    NET_FILE = "models/best_net_32.npy"
+
     def __init__(self, uc: UnitController):
         self.uc = uc
         genetic_manager = GeneticManager.get_instance()
@@ -17,12 +122,13 @@ class UnitPlayer(UnitPlayerBase):
         if genetic_manager is not None:
             self.net = genetic_manager.get_current_net()
         else:
-            self.net = Net(**{
-                'input_nodes': 118,
-                'hidden_nodes': 16,
-                'output_nodes': 9,
-            })
-            self.net.load("models/best_net_32.npy")
+            self.net = load_net(self.NET_FILE)
+
+        world_manager = uc.unit.world_manager
+        self.team_inference = team_inferences.get(world_manager)
+
+        if self.team_inference is None:
+            self.team_inference = team_inferences[world_manager] = TeamInference()
 
     def attack_enemies(self, enemies):
         if self.uc.unit.team == Team.BLUE:
@@ -47,41 +153,8 @@ class UnitPlayer(UnitPlayerBase):
         self.attack_enemies(enemies)
 
     def play_net(self):
-        # Sense the world
-        visible_locations = self.uc.get_visible_locations()
-        visible_locations = []
-
-        for x in range(-5, 6):
-            for y in range(-5, 6):
-                curr_loc = self.uc.get_current_location()
-                loc = Location(curr_loc.x + x, curr_loc.y + y)
-                
-                if self.uc.unit.location.distance_squared(loc) <= self.uc.unit.vision_range:
-                    visible_locations.append(loc)
-
-        # Prepare net inputs
-        inputs = [self.uc.unit.health / self.uc.unit.max_health]
-
-        for location in visible_locations:
-            if not self.uc.unit.world.is_accessible(location):
-                inputs.append(0)
-                continue
-
-            unit = self.uc.sense_unit_at_location(location)
-
-            if unit is None:
-                inputs.append(0)
-            elif unit.team == self.uc.unit.team:
-                inputs.append(unit.health / unit.max_health + 1)
-            else:
-                inputs.append(-unit.health / unit.max_health)
-
-        # Run the net
-        outputs = self.net.forward(inputs)
-
-        # Choose the best direction
-        best_direction = int(np.argmax(outputs))
-
+        # Choose the best direction, the net runs once per turn for the whole team
+        best_direction = self.team_inference.get_direction(self)
 
         enemies = self.uc.sense_enemy_units()
         self.attack_enemies(enemies)
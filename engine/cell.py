@@ -7,25 +7,32 @@ from typing import Optional
 class Cell:
     """
     Class representing a cell in the grid.
+
+    A cell is a thin view over the arrays held by the world, so it is cheap
+    to create and always reflects the current state of the map.
     """
 
-    def __init__(self, location: Location):
+    def __init__(self, world: 'World', location: Location):
+        self.world = world
         self.location = location
-        self.__obstacle = False
-        self.__unit = None
 
     def add_obstacle(self):
-        self.__obstacle = True
+        self.world.obstacle_map[self.location.x, self.location.y] = True
 
     def has_obstacle(self) -> bool:
-        return self.__obstacle
+        return bool(self.world.obstacle_map[self.location.x, self.location.y])
 
     def set_unit(self, unit: Optional[Unit]):
-        self.__unit = unit
+        if unit is None:
+            self.world.clear_location(self.location)
+        else:
+            self.world.place_unit(unit, self.location)
 
     def get_unit(self) -> Optional[Unit]:
-        return self.__unit
+        return self.world.get_unit_at_location(self.location)
 
     def hit(self, attacker: Unit):
-        if self.__unit is not None:
-            self.__unit.receive_damage(attacker.attack)
\ No newline at end of file
+        unit = self.get_unit()
+
+        if unit is not None:
+            unit.receive_damage(attacker.attack)
@@ -27,17 +27,30 @@ class Direction:
         ZERO
     )
 
-    def __init__(self, dx: int, dy: int):
-        self.dx = dx
-        self.dy = dy
+    __slots__ = ('dx', 'dy', 'index')
+
+    def __new__(cls, dx: int, dy: int):
+        # Unit directions are interned: Direction(dx, dy) always returns the
+        # same shared instance, so they must never be mutated.
+        direction = _INTERNED.get((dx, dy))
+
+        if direction is None:
+            direction = object.__new__(cls)
+            direction.dx = dx
+            direction.dy = dy
+            direction.index = None
+
+        return direction
+
+    def __reduce__(self):
+        return Direction, (self.dx, self.dy)
 
     @staticmethod
     def from_index(index: int) -> 'Direction':
         """
         Returns the direction from an index.
         """
-        dx, dy = Direction.DIRECTIONS[index]
-        return Direction(dx, dy)
+        return _BY_INDEX[index]
 
     @staticmethod
     def random_direction():
@@ -52,53 +65,45 @@ class Direction:
         Returns the direction from start_location to end_location.
         """
         if start_location == end_location:
-            return Direction(Direction.ZERO[0], Direction.ZERO[1])
+            return _INTERNED[Direction.ZERO]
         if start_location.x == end_location.x:
             if start_location.y > end_location.y:
-                return Direction(Direction.NORTH[0], Direction.NORTH[1])
+                return _INTERNED[Direction.NORTH]
             else:
-                return Direction(Direction.SOUTH[0], Direction.SOUTH[1])
+                return _INTERNED[Direction.SOUTH]
         if start_location.y == end_location.y:
             if start_location.x > end_location.x:
-                return Direction(Direction.WEST[0], Direction.WEST[1])
+                return _INTERNED[Direction.WEST]
             else:
-                return Direction(Direction.EAST[0], Direction.EAST[1])
+                return _INTERNED[Direction.EAST]
         if start_location.x > end_location.x:
             if start_location.y > end_location.y:
-                return Direction(Direction.NORTH_WEST[0], Direction.NORTH_WEST[1])
+                return _INTERNED[Direction.NORTH_WEST]
             else:
-                return Direction(Direction.SOUTH_WEST[0], Direction.SOUTH_WEST[1])
+                return _INTERNED[Direction.SOUTH_WEST]
         else:
             if start_location.y > end_location.y:
-                return Direction(Direction.NORTH_EAST[0], Direction.NORTH_EAST[1])
+                return _INTERNED[Direction.NORTH_EAST]
             else:
-                return Direction(Direction.SOUTH_EAST[0], Direction.SOUTH_EAST[1])
+                return _INTERNED[Direction.SOUTH_EAST]
 
     def rotate_clockwise(self):
         """
         Rotates the direction clockwise.
         """
-        index = Direction.DIRECTIONS.index(self)
+        if self.index is None:
+            raise ValueError(f"{self} is not a unit direction")
 
-        if index == len(Direction.DIRECTIONS) - 1:
-            return self
-        elif index == len(Direction.DIRECTIONS) - 2:
-            return Direction(Direction.DIRECTIONS[0][0], Direction.DIRECTIONS[0][1])
-        else:
-            return Direction(Direction.DIRECTIONS[index + 1][0], Direction.DIRECTIONS[index + 1][1])
+        return _CLOCKWISE[self.index]
 
     def rotate_counter_clockwise(self):
         """
         Rotates the direction counter clockwise.
         """
-        index = Direction.DIRECTIONS.index(self)
+        if self.index is None:
+            raise ValueError(f"{self} is not a unit direction")
 
-        if index == len(Direction.DIRECTIONS) - 1:
-            return self
-        elif index == 0:
-            return Direction(Direction.DIRECTIONS[len(Direction.DIRECTIONS) - 2][0], Direction.DIRECTIONS[len(Direction.DIRECTIONS) - 2][1])
-        else:
-            return Direction(Direction.DIRECTIONS[index - 1][0], Direction.DIRECTIONS[index - 1][1])
+        return _COUNTER_CLOCKWISE[self.index]
 
     def __getitem__(self, key):
         if key == 0:
@@ -109,7 +114,26 @@ class Direction:
             raise IndexError("Index out of range")
 
     def __eq__(self, other):
-        return self.dx == other[0] and self.dy == other[1]
+        return self is other or (self.dx == other[0] and self.dy == other[1])
+
+    def __hash__(self):
+        return hash((self.dx, self.dy))
 
     def __str__(self):
         return f"Direction({self.dx}, {self.dy})"
+
+
+_INTERNED = {}
+_BY_INDEX = []
+
+for _index, (_dx, _dy) in enumerate(Direction.DIRECTIONS):
+    _direction = object.__new__(Direction)
+    _direction.dx = _dx
+    _direction.dy = _dy
+    _direction.index = _index
+    _INTERNED[(_dx, _dy)] = _direction
+    _BY_INDEX.append(_direction)
+
+# ZERO is the last direction and rotates onto itself.
+_CLOCKWISE = tuple(_BY_INDEX[(i + 1) % 8] for i in range(8)) + (_BY_INDEX[8],)
+_COUNTER_CLOCKWISE = tuple(_BY_INDEX[(i - 1) % 8] for i in range(8)) + (_BY_INDEX[8],)
@@ -1,7 +1,9 @@
 import enum
 
+import numpy as np
+
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from .location import Location
 
@@ -13,6 +15,13 @@ class GameActionType(enum.Enum):
     HEAL = 3
 
 
+class GameLogMode(enum.Enum):
+    """Enum for how much of the game the log keeps."""
+    DISABLED = 0
+    RING = 1
+    FULL = 2
+
+
 @dataclass
 class GameAction:
     """
@@ -24,16 +33,188 @@ class GameAction:
     target_location: Optional[Location]
 
 
+COLUMNS = (
+    ('turn', np.int32),
+    ('action_type', np.int8),
+    ('unit_id', np.int32),
+    ('subject_x', np.int32),
+    ('subject_y', np.int32),
+    ('target_x', np.int32),
+    ('target_y', np.int32),
+)
+
+
 class GameLog:
     """
     Game log class that stores game actions.
+
+    Actions are stored as columns of arrays, one row per action. Rows are
+    numbered from the start of the game and row r is stored at index
+    r % capacity, so the arrays are used as a ring. Depending on the mode,
+    the log keeps every turn, only the last max_turns turns, or nothing
+    at all. Dropping the oldest turns of a ring only moves its start, and
+    the arrays only grow when the stored turns do not fit.
     """
 
-    def __init__(self):
-        self.actions: List[List[GameAction]] = [[]]
+    def __init__(self, mode: GameLogMode = GameLogMode.FULL, max_turns: Optional[int] = None,
+                 capacity: int = 256):
+        if mode == GameLogMode.RING and not max_turns:
+            raise ValueError("A ring game log needs max_turns")
+
+        self.mode = mode
+        self.max_turns = max_turns
+        self.columns: Dict[str, np.ndarray] = {name: np.zeros(capacity, dtype=dtype)
+                                               for name, dtype in COLUMNS}
+        self.capacity = capacity
+        # Number of rows logged since the start of the game.
+        self.end = 0
+        self.turn = 0
+        # Oldest turn still stored, and the row where each turn starts from
+        # turn_starts[head], the start of the oldest turn, on.
+        self.first_turn = 0
+        self.turn_starts: List[int] = [0]
+        self.head = 0
+        self._actions: Optional[List[List[GameAction]]] = None
+
+    def __len__(self) -> int:
+        return self.end - self.turn_starts[self.head]
 
     def new_turn(self):
-        self.actions.append([])
+        self.turn += 1
+        self._actions = None
+
+        if self.mode == GameLogMode.DISABLED:
+            self.first_turn = self.turn
+            return
+
+        self.turn_starts.append(self.end)
+
+        if self.mode == GameLogMode.RING and len(self.turn_starts) - self.head > self.max_turns:
+            self.drop_turns(len(self.turn_starts) - self.head - self.max_turns)
+
+    def drop_turns(self, count: int):
+        """
+        Drops the oldest turns stored.
+        """
+        self.head += count
+        self.first_turn += count
+
+        # Forget the starts of dropped turns once they are half of the list.
+        if self.head > len(self.turn_starts) // 2:
+            del self.turn_starts[:self.head]
+            self.head = 0
+
+    def grow(self):
+        """
+        Doubles the capacity of the columns, keeping the stored rows.
+        """
+        rows = np.arange(self.turn_starts[self.head], self.end)
+        capacity = 2 * self.capacity
+
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[rows % capacity] = column[rows % self.capacity]
+            self.columns[name] = grown
+
+        self.capacity = capacity
+
+    def log_action(self, action_type: GameActionType, unit_id: int,
+                   subject_location: Location, target_location: Location):
+        """
+        Appends an action to the current turn.
+        """
+        if self.mode == GameLogMode.DISABLED:
+            return
+
+        if self.end - self.turn_starts[self.head] == self.capacity:
+            self.grow()
+
+        row = self.end % self.capacity
+        columns = self.columns
+        columns['turn'][row] = self.turn
+        columns['action_type'][row] = action_type.value
+        columns['unit_id'][row] = unit_id
+        columns['subject_x'][row] = subject_location.x
+        columns['subject_y'][row] = subject_location.y
+        columns['target_x'][row] = target_location.x
+        columns['target_y'][row] = target_location.y
+        self.end += 1
+        self._actions = None
 
     def add_action(self, action: GameAction):
-        self.actions[-1].append(action)
\ No newline at end of file
+        self.log_action(action.action_type, action.unit_id,
+                        action.subject_location, action.target_location)
+
+    def turn_rows(self, turn: int) -> Tuple[int, int]:
+        """
+        Returns the first and end rows of a turn, which are equal if the turn is not stored.
+        """
+        index = turn - self.first_turn + self.head
+
+        if index < self.head or index >= len(self.turn_starts):
+            return 0, 0
+
+        end = self.turn_starts[index + 1] if index + 1 < len(self.turn_starts) else self.end
+        return self.turn_starts[index], end
+
+    def get_turn(self, turn: int) -> Dict[str, np.ndarray]:
+        """
+        Returns the columns restricted to the actions of a turn: views,
+        or copies if the turn wraps around the end of the ring.
+        """
+        first, end = self.turn_rows(turn)
+        start = first % self.capacity
+
+        if start + end - first <= self.capacity:
+            return {name: column[start:start + end - first] for name, column in self.columns.items()}
+
+        rows = np.arange(first, end) % self.capacity
+        return {name: column[rows] for name, column in self.columns.items()}
+
+    def get_actions(self, turn: int) -> List[GameAction]:
+        """
+        Returns the actions of a turn as GameAction objects.
+        """
+        columns = self.get_turn(turn)
+        return [GameAction(GameActionType(action_type), unit_id,
+                           Location.at(subject_x, subject_y), Location.at(target_x, target_y))
+                for action_type, unit_id, subject_x, subject_y, target_x, target_y in zip(
+                    columns['action_type'].tolist(), columns['unit_id'].tolist(),
+                    columns['subject_x'].tolist(), columns['subject_y'].tolist(),
+                    columns['target_x'].tolist(), columns['target_y'].tolist())]
+
+    @property
+    def actions(self) -> List[List[GameAction]]:
+        """
+        The stored actions grouped by turn, oldest first. The list is built
+        again after the log changes, get_turn is cheaper for a few turns.
+        """
+        if self._actions is None:
+            self._actions = [self.get_actions(turn) for turn in range(self.first_turn, self.turn + 1)]
+
+        return self._actions
+
+    def mark(self) -> Tuple[int, int]:
+        """
+        Returns a mark of the current end of the log.
+        """
+        return self.turn, self.end
+
+    def truncate(self, mark: Tuple[int, int]):
+        """
+        Drops every action logged after a mark.
+        Turns that a ring log dropped since the mark are not recovered.
+        """
+        turn, rows = mark
+        self.turn = turn
+        self.end = rows
+        self._actions = None
+
+        if (turn >= self.first_turn and rows >= self.turn_starts[self.head]
+                and self.mode != GameLogMode.DISABLED):
+            del self.turn_starts[turn - self.first_turn + self.head + 1:]
+        else:
+            # The turn of the mark was already dropped from the log.
+            self.first_turn = turn
+            self.turn_starts = [rows]
+            self.head = 0
@@ -0,0 +1,174 @@
+import functools
+import random
+
+import numpy as np
+
+from typing import Any, Dict, Optional, Tuple
+from .direction import Direction
+from .team import Team
+from .unit_controller import UnitController
+from .unit_player import UnitPlayerBase
+from .vec_world import (NO_ATTACK, OBS_ALIVE, OBS_ATTACK_COOLDOWN, OBS_FEATURES, OBS_HEALTH,
+                        OBS_MOVEMENT_COOLDOWN, OBS_X, OBS_Y)
+from .world_manager import WorldManager
+
+
+class ActionUnitPlayer(UnitPlayerBase):
+    """
+    UnitPlayer that plays the actions written into the buffer of an environment.
+
+    Row u of the buffer holds the action of the unit with index u
+    (its position in the map file): a direction index to move and
+    the index of the unit whose location to attack, or NO_ATTACK.
+    """
+
+    def __init__(self, uc: UnitController, env: 'TacticsBattleEnv'):
+        self.uc = uc
+        self.env = env
+
+    def run(self):
+        direction, target = self.env.actions[self.uc.unit.id - 1].tolist()
+        self.uc.move(Direction.from_index(direction))
+
+        if target != NO_ATTACK:
+            target_unit = self.uc.unit.world.get_unit_by_id(target + 1)
+
+            if target_unit is not None:
+                self.uc.attack(target_unit.location)
+
+
+class TacticsBattleEnv:
+    """
+    Gymnasium-style environment where an agent controls the units of one
+    team against an opponent UnitPlayer.
+
+    Actions are arrays of shape (num_units, 2) with the same meaning as in
+    VecWorld; rows of units of the opponent team are ignored. Observations
+    use the VecWorld layout. The observation returned by reset and step is
+    a buffer that is overwritten by the next call.
+
+    The reward is the change in health difference between the teams,
+    normalized by the total health of the map, plus 1 for a win and -1
+    for a loss.
+    """
+
+    def __init__(self, map_file: str, opponent_class: UnitPlayerBase,
+                 team: Team = Team.BLUE, max_turns: int = 100):
+        self.map_file = map_file
+        self.opponent_class = opponent_class
+        self.team = team
+        self.max_turns = max_turns
+        self.world_manager = self.new_game()
+        self.num_units = len(self.world_manager.unit_players)
+        self.actions = np.zeros((self.num_units, 2), dtype=np.int64)
+        self.actions[:, 0] = Direction.DIRECTIONS.index(Direction.ZERO)
+        self.actions[:, 1] = NO_ATTACK
+        self.observation = np.zeros((self.num_units, OBS_FEATURES), dtype=np.float32)
+        self.reward = np.zeros(1, dtype=np.float64)
+        self.terminated = np.zeros(1, dtype=bool)
+        self.truncated = np.zeros(1, dtype=bool)
+        self.total_health = sum(unit_player.uc.unit.max_health
+                                for unit_player in self.world_manager.unit_players.values())
+        self.health_difference = 0.0
+
+    @functools.cached_property
+    def observation_space(self):
+        from gymnasium import spaces
+        return spaces.Box(low=0.0, high=np.inf, shape=self.observation.shape, dtype=np.float32)
+
+    @functools.cached_property
+    def action_space(self):
+        from gymnasium import spaces
+        nvec = np.empty((self.num_units, 2), dtype=np.int64)
+        nvec[:, 0] = len(Direction.DIRECTIONS)
+        # Targets are shifted by one so that 0 means NO_ATTACK.
+        nvec[:, 1] = self.num_units + 1
+        return spaces.MultiDiscrete(nvec)
+
+    def new_game(self) -> WorldManager:
+        """
+        Creates the game of the environment, with the agent and opponent players.
+        Episodes reset it instead of creating a new one.
+        """
+        agent_class = functools.partial(ActionUnitPlayer, env=self)
+
+        if self.team == Team.RED:
+            classes = agent_class, self.opponent_class
+        else:
+            classes = self.opponent_class, agent_class
+
+        return WorldManager(self.map_file, *classes, {
+            "max_turns": self.max_turns,
+        })
+
+    def reset(self, seed: Optional[int] = None, options: Optional[dict] = None) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Starts a new game by resetting the game of the environment in place.
+
+        Args:
+            seed: Seed for the random number generators used by the brains.
+            options: Unused, kept for Gymnasium compatibility.
+        """
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
+
+        self.world_manager.reset()
+        self.health_difference = self.observe()
+        return self.observation, self.info()
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, float, bool, bool, Dict[str, Any]]:
+        """
+        Plays one turn with the given actions.
+        """
+        self.actions[:] = actions
+        winner = self.world_manager.play_turn()
+
+        health_difference = self.observe()
+        self.reward[0] = (health_difference - self.health_difference) / self.total_health
+        self.health_difference = health_difference
+
+        if winner is not None:
+            self.reward[0] += 1.0 if winner == self.team else -1.0
+
+        self.terminated[0] = self.world_manager.game_over
+        self.truncated[0] = (not self.world_manager.game_over
+                             and self.world_manager.turn >= self.max_turns)
+
+        return self.observation, float(self.reward[0]), bool(self.terminated[0]), bool(self.truncated[0]), self.info()
+
+    def observe(self) -> float:
+        """
+        Writes the state of the units into the observation buffer.
+
+        Returns:
+            The health of the agent's team minus the health of the opponents.
+        """
+        obs = self.observation
+        obs[:, OBS_HEALTH] = 0.0
+        obs[:, OBS_ALIVE] = 0.0
+        health_difference = 0.0
+
+        for unit_player in self.world_manager.unit_players.values():
+            unit = unit_player.uc.unit
+
+            if not unit.is_alive():
+                continue
+
+            row = obs[unit.id - 1]
+            row[OBS_X] = unit.location.x
+            row[OBS_Y] = unit.location.y
+            row[OBS_HEALTH] = unit.health / unit.max_health
+            row[OBS_ALIVE] = 1.0
+            row[OBS_MOVEMENT_COOLDOWN] = unit.current_movement_cooldown
+            row[OBS_ATTACK_COOLDOWN] = unit.current_attack_cooldown
+
+            if unit.team == self.team:
+                health_difference += unit.health
+            else:
+                health_difference -= unit.health
+
+        return health_difference
+
+    def info(self) -> Dict[str, Any]:
+        return {"turn": self.world_manager.turn}
@@ -1,11 +1,49 @@
+from typing import List
+
 from .direction import Direction
 
 
 class Location:
+    __slots__ = ('x', 'y')
+
+    # Shared instances for the in-bounds coordinates of the loaded maps, indexed [x][y].
+    _interned: List[List['Location']] = []
+
     def __init__(self, x: int, y: int):
         self.x = x
         self.y = y
 
+    @classmethod
+    def intern_grid(cls, width: int, height: int):
+        """
+        Makes Location.at return shared instances for every coordinate
+        of a width x height map. Interned locations must never be mutated.
+        """
+        interned = cls._interned
+
+        for x in range(width):
+            if x == len(interned):
+                interned.append([])
+
+            column = interned[x]
+            column.extend(Location(x, y) for y in range(len(column), height))
+
+    @classmethod
+    def at(cls, x: int, y: int) -> 'Location':
+        """
+        Returns the interned location at (x, y) if there is one, or a new location otherwise.
+        """
+        if x >= 0 and y >= 0:
+            interned = cls._interned
+
+            if x < len(interned):
+                column = interned[x]
+
+                if y < len(column):
+                    return column[y]
+
+        return Location(x, y)
+
     def distance_squared(self, other: 'Location') -> int:
         return (self.x - other.x) ** 2 + (self.y - other.y) ** 2
 
@@ -16,13 +54,13 @@ class Location:
             return Direction.get_direction(self, other)
 
     def add_direction(self, direction: Direction) -> 'Location':
-        return Location(self.x + direction.dx, self.y + direction.dy)
+        return Location.at(self.x + direction.dx, self.y + direction.dy)
 
     def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
+        return self is other or (self.x == other.x and self.y == other.y)
 
     def __hash__(self):
         return hash((self.x, self.y))
 
     def __str__(self):
-        return f"Location({self.x}, {self.y})"
\ No newline at end of file
+        return f"Location({self.x}, {self.y})"
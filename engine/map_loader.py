@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+
+from dataclasses import dataclass
+from typing import Dict, Tuple, Type
+from .team import Team
+from .unit_types.archer import Archer
+from .unit_types.unit_type import UnitType
+
+
+UNIT_TYPES: Dict[str, Type[UnitType]] = {
+    'A': Archer,
+}
+
+TEAMS: Dict[str, Team] = {
+    'R': Team.RED,
+    'B': Team.BLUE,
+    'N': Team.NEUTRAL,
+}
+
+
+@dataclass(frozen=True)
+class MapUnit:
+    """
+    A unit placed on a map.
+    """
+    x: int
+    y: int
+    team: Team
+    unit_type: Type[UnitType]
+
+
+@dataclass(frozen=True)
+class MapTemplate:
+    """
+    Immutable description of a parsed map file.
+    """
+    width: int
+    height: int
+    obstacles: Tuple[Tuple[int, int], ...]
+    units: Tuple[MapUnit, ...]
+    obstacle_map: np.ndarray
+
+
+# Parsed maps by path, along with the modification time of the file when it was parsed.
+_cache: Dict[str, Tuple[int, MapTemplate]] = {}
+
+
+def parse_map(map_file: str) -> MapTemplate:
+    """
+    Parses a map file.
+
+    The file should be a text file with the following format:
+    - The first line should be the width and height of the map.
+    - The following lines are the locations of obstacles and units.
+        The first character of each line is either 'O' (obstacle) or 'U' (unit).
+        The second character is the x-coordinate of the location.
+        The third character is the y-coordinate of the location.
+        The fourth character is the team of the unit.
+        The fifth character is the unit type of the unit.
+
+    Args:
+        map_file: The file to load the map from.
+    """
+    obstacles = []
+    units = []
+
+    with open(map_file, 'r', encoding="utf-8") as f:
+        lines = f.readlines()
+        width, height = [int(x) for x in lines[0].split()]
+
+        for line in lines[1:]:
+            line = line.strip().split()
+
+            if line[0] == 'O':
+                obstacles.append((int(line[1]), int(line[2])))
+            elif line[0] == 'U':
+                unit_type = UNIT_TYPES.get(line[4])
+                team = TEAMS.get(line[3])
+
+                if unit_type is None:
+                    raise Exception("Unknown unit type: " + line[4])
+
+                if team is None:
+                    raise Exception("Unknown team: " + line[3])
+
+                units.append(MapUnit(int(line[1]), int(line[2]), team, unit_type))
+
+    obstacle_map = np.zeros((width, height), dtype=bool)
+
+    for x, y in obstacles:
+        obstacle_map[x, y] = True
+
+    obstacle_map.setflags(write=False)
+    return MapTemplate(width, height, tuple(obstacles), tuple(units), obstacle_map)
+
+
+def load_map_template(map_file: str) -> MapTemplate:
+    """
+    Returns the template of a map file, parsing it only if it was not
+    parsed before or if it changed since then.
+    """
+    path = os.path.abspath(map_file)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _cache.get(path)
+
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    template = parse_map(path)
+    _cache[path] = mtime, template
+    return template
@@ -0,0 +1,298 @@
+"""
+Profiling of the phases of a game.
+
+WorldManager calls the hooks of a Profiler around the phases of every
+turn when config['profile'] is set: the start_turn and run of every
+unit, the move, attack and sense_* calls of the unit controllers, the
+win check and the replay. Without a profiler none of the hooks run and
+the unit controllers are not wrapped.
+
+The phases of a unit are counted for its team. run includes the unit
+controller calls made by the brain, the brain phase of the reports is
+what remains of it.
+"""
+import cProfile
+import dataclasses
+import functools
+import io
+import json
+import os
+import pstats
+import re
+import time
+import tracemalloc
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+from .team import Team
+from .unit_controller import UnitController
+
+
+COUNTERS = 'counters'
+CPROFILE = 'cprofile'
+TRACEMALLOC = 'tracemalloc'
+PROFILE_MODES = (COUNTERS, CPROFILE, TRACEMALLOC)
+
+# Phases timed in the unit controllers.
+CONTROLLER_PHASES = ('move', 'attack', 'sense_unit_at_location', 'sense_units',
+                     'sense_ally_units', 'sense_enemy_units', 'sense_obstacles')
+BRAIN_PHASE = 'brain'
+# Key of the phases that belong to the game rather than to a team.
+GAME = 'game'
+# Name the phases of neutral units are reported under.
+NEUTRAL = 'neutral'
+
+
+@dataclass
+class PhaseStats:
+    """
+    Number of calls and total time of a phase.
+    """
+    calls: int = 0
+    ns: int = 0
+
+    def add(self, other: 'PhaseStats'):
+        self.calls += other.calls
+        self.ns += other.ns
+
+
+@dataclass
+class GameProfile:
+    """
+    Profile of a game: the phases of each team (by Team name) and of the game,
+    and, depending on the mode, the top functions and allocations.
+    """
+    map_file: str
+    red: str
+    blue: str
+    mode: str
+    turns: int = 0
+    ns: int = 0
+    phases: Dict[str, Dict[str, PhaseStats]] = field(default_factory=dict)
+    functions: Optional[str] = None
+    peak_memory: Optional[int] = None
+    allocations: List[str] = field(default_factory=list)
+
+    def brain_phases(self) -> Dict[str, Dict[str, PhaseStats]]:
+        """
+        Returns the phases by brain name instead of team, the phases of
+        the game under GAME.
+        """
+        brains = {Team.RED.name: self.red, Team.BLUE.name: self.blue,
+                  Team.NEUTRAL.name: NEUTRAL, GAME: GAME}
+        phases: Dict[str, Dict[str, PhaseStats]] = {}
+
+        for key, stats in self.phases.items():
+            for phase, phase_stats in stats.items():
+                phases.setdefault(brains[key], {}).setdefault(phase, PhaseStats()).add(phase_stats)
+
+        return phases
+
+
+def brain_name(unit_player_class: type) -> str:
+    """
+    Returns the name of a brain from its UnitPlayer class, in the form
+    brains.load_player accepts.
+    """
+    base = unit_player_class.__mro__[1]
+
+    if 'NET_FILE' in unit_player_class.__dict__ and hasattr(base, 'NET_FILE'):
+        # A brain playing another net, as created by brains.load_player.
+        return f'{brain_name(base)}:{unit_player_class.NET_FILE}'
+
+    parts = unit_player_class.__module__.split('.')
+    return parts[1] if len(parts) == 3 and parts[0] == 'brains' else unit_player_class.__qualname__
+
+
+class Profiler:
+    """
+    Counts the calls and time of every phase of a game.
+
+    Subclasses can override the hooks to collect something else. With
+    the CPROFILE mode the turns also run under cProfile, and with the
+    TRACEMALLOC mode the allocations of the game are traced.
+    """
+
+    def __init__(self, mode: str = COUNTERS, top: int = 20):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'Unknown profile mode {mode}, expected one of {PROFILE_MODES}')
+
+        self.mode = mode
+        self.top = top
+        self.profile: Optional[GameProfile] = None
+        self.counters: Dict[str, Dict[str, PhaseStats]] = {}
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.started_tracemalloc = False
+        self.start_ns = 0
+
+    def start_game(self, map_file: str, red: str, blue: str):
+        self.profile = GameProfile(map_file, red, blue, self.mode)
+        self.counters = {key: {} for key in [team.name for team in Team] + [GAME]}
+        self.start_ns = time.perf_counter_ns()
+
+        if self.mode == CPROFILE:
+            self.cprofile = cProfile.Profile()
+
+        if self.mode == TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+
+        if self.mode == TRACEMALLOC:
+            tracemalloc.reset_peak()
+
+    def start_turn(self):
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def end_turn(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+        if self.profile is not None:
+            self.profile.turns += 1
+
+    def record(self, team: Optional[Team], phase: str, ns: int):
+        """
+        Adds a call of a phase that took ns nanoseconds, for a team or
+        for the game when team is None.
+        """
+        stats = self.counters[GAME if team is None else team.name].get(phase)
+
+        if stats is None:
+            stats = self.counters[GAME if team is None else team.name][phase] = PhaseStats()
+
+        stats.calls += 1
+        stats.ns += ns
+
+    def end_game(self) -> GameProfile:
+        """
+        Finishes the profile of the game and returns it.
+        """
+        profile = self.profile
+        profile.ns = time.perf_counter_ns() - self.start_ns
+
+        for stats in self.counters.values():
+            if 'run' in stats:
+                controller_ns = sum(stats[phase].ns for phase in CONTROLLER_PHASES if phase in stats)
+                stats[BRAIN_PHASE] = PhaseStats(stats['run'].calls, stats['run'].ns - controller_ns)
+
+        profile.phases = self.counters
+
+        if self.cprofile is not None:
+            output = io.StringIO()
+            pstats.Stats(self.cprofile, stream=output).sort_stats('cumulative').print_stats(self.top)
+            profile.functions = output.getvalue()
+            self.cprofile = None
+
+        if self.mode == TRACEMALLOC:
+            profile.peak_memory = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)])
+            statistics = snapshot.statistics('lineno')
+            profile.allocations = [str(statistic) for statistic in statistics[:self.top]]
+
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+                self.started_tracemalloc = False
+
+        # Turns played after the end of the game, for instance after
+        # restoring a snapshot, are not added to the finished profile.
+        self.profile = None
+        self.counters = {key: {} for key in self.counters}
+        return profile
+
+
+def _profiled(phase: str):
+    method = getattr(UnitController, phase)
+
+    @functools.wraps(method)
+    def profiled(self, *args):
+        start = time.perf_counter_ns()
+
+        try:
+            return method(self, *args)
+        finally:
+            self.profiler.record(self.unit.team, phase, time.perf_counter_ns() - start)
+
+    return profiled
+
+
+class ProfiledUnitController(UnitController):
+    """
+    UnitController that records its calls to a profiler.
+    """
+
+    def __init__(self, unit, world, game_log, profiler: Profiler):
+        super().__init__(unit, world, game_log)
+        self.profiler = profiler
+
+    move = _profiled('move')
+    attack = _profiled('attack')
+    sense_unit_at_location = _profiled('sense_unit_at_location')
+    sense_units = _profiled('sense_units')
+    sense_ally_units = _profiled('sense_ally_units')
+    sense_enemy_units = _profiled('sense_enemy_units')
+    sense_obstacles = _profiled('sense_obstacles')
+
+
+def profile_path(pattern: str, profile: GameProfile, game: int) -> str:
+    """
+    Returns the file of a game profile from a pattern that can contain
+    {game}, {red}, {blue}, {map} and {pid}.
+    """
+    def clean(name: str) -> str:
+        return re.sub(r'[^\w.-]', '_', name)
+
+    return pattern.format(game=game, red=clean(profile.red), blue=clean(profile.blue),
+                          map=clean(os.path.splitext(os.path.basename(profile.map_file))[0]),
+                          pid=os.getpid())
+
+
+def save_profile(profile: GameProfile, path: str):
+    directory = os.path.dirname(path)
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, 'w') as file:
+        json.dump(dataclasses.asdict(profile), file, indent=1)
+
+
+def load_profile(path: str) -> GameProfile:
+    with open(path) as file:
+        data = json.load(file)
+
+    data['phases'] = {key: {phase: PhaseStats(**stats) for phase, stats in phases.items()}
+                      for key, phases in data['phases'].items()}
+    return GameProfile(**data)
+
+
+def aggregate_profiles(profiles: Iterable[GameProfile]) -> Dict[str, Dict[str, PhaseStats]]:
+    """
+    Sums the phases of several games by brain, the phases of the games under GAME.
+    """
+    totals: Dict[str, Dict[str, PhaseStats]] = {}
+
+    for profile in profiles:
+        for brain, phases in profile.brain_phases().items():
+            for phase, stats in phases.items():
+                totals.setdefault(brain, {}).setdefault(phase, PhaseStats()).add(stats)
+
+    return totals
+
+
+def format_phases(phases: Dict[str, Dict[str, PhaseStats]]) -> List[str]:
+    """
+    Returns report lines with the calls, total time and time per call
+    of every phase, the slowest first.
+    """
+    lines = []
+
+    for key in sorted(phases, key=lambda key: (key == GAME, key)):
+        lines.append(f'{key}:')
+
+        for phase, stats in sorted(phases[key].items(), key=lambda item: -item[1].ns):
+            lines.append(f'  {phase:24} {stats.calls:10} calls {stats.ns / 1e6:10.1f} ms '
+                         f'{stats.ns / max(1, stats.calls):10.0f} ns/call')
+
+    return lines
@@ -0,0 +1,346 @@
+"""
+Replay files store a game as its map, the actions of every turn and
+periodic keyframes with the full state of the units.
+
+Layout, little-endian:
+- Header: HEADER (magic, version, width, height, number of units,
+  keyframe interval), the obstacle map as packed bits, and a row of
+  UNIT_DTYPE per unit in the order of their ids.
+- Records, one after the other:
+  - b'K', turn (u32), a row of STATE_DTYPE per unit: the state at the start of the turn.
+  - b'T', turn (u32), count (u32), count rows of ACTION_DTYPE: the actions of the turn.
+- Index, written when the replay is closed: the offset of the record of
+  every turn (u64), the turns (u32) and offsets (u64) of the keyframes,
+  and TRAILER. Files without an index are scanned when they are opened.
+"""
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from .game_log import GameActionType
+from .map_loader import UNIT_TYPES, MapTemplate
+from .unit import Unit
+from .world import EMPTY, NO_TEAM, World
+
+
+MAGIC = b'TBRP'
+INDEX_MAGIC = b'TBRI'
+VERSION = 1
+HEADER = struct.Struct('<4sHIIII')
+TRAILER = struct.Struct('<QQII4s')
+RECORD = struct.Struct('<cI')
+COUNT = struct.Struct('<I')
+KEYFRAME = b'K'
+TURN = b'T'
+
+UNIT_DTYPE = np.dtype([('x', '<i2'), ('y', '<i2'), ('team', 'i1'), ('unit_type', 'S1')])
+STATE_DTYPE = np.dtype([('x', '<i2'), ('y', '<i2'), ('health', '<i4'),
+                        ('movement_cooldown', '<f8'), ('attack_cooldown', '<f8')])
+ACTION_DTYPE = np.dtype([('action_type', 'i1'), ('unit_id', '<i4'),
+                         ('subject_x', '<i2'), ('subject_y', '<i2'),
+                         ('target_x', '<i2'), ('target_y', '<i2')])
+
+UNIT_TYPE_CODES = {unit_type: code.encode() for code, unit_type in UNIT_TYPES.items()}
+
+
+class ReplayWriter:
+    """
+    Streams a game to a replay file: a keyframe every keyframe_interval
+    turns and the actions of every turn.
+    """
+
+    def __init__(self, path: str, template: MapTemplate, keyframe_interval: int = 50):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        # The units of the map in order of id, including those that are removed later.
+        self.units: Optional[List[Unit]] = None
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.file: BinaryIO = open(path, 'wb')
+        self.turn_offsets: List[int] = []
+        self.keyframe_turns: List[int] = []
+        self.keyframe_offsets: List[int] = []
+
+        units = np.array([(unit.x, unit.y, unit.team.value, UNIT_TYPE_CODES[unit.unit_type])
+                          for unit in template.units], dtype=UNIT_DTYPE)
+        self.file.write(HEADER.pack(MAGIC, VERSION, template.width, template.height,
+                                    len(units), keyframe_interval))
+        self.file.write(np.packbits(template.obstacle_map, axis=None).tobytes())
+        self.file.write(units.tobytes())
+
+    def write_keyframe(self, world: World, turn: int):
+        """
+        Writes the state of the units at the start of a turn.
+        Units are indexed by id, so removed units are stored with their last state.
+        """
+        if self.units is None:
+            self.units = sorted(world.units_by_id.values(), key=lambda unit: unit.id)
+
+        state = np.array([(unit.location.x, unit.location.y, unit.health,
+                           unit.current_movement_cooldown, unit.current_attack_cooldown)
+                          for unit in self.units], dtype=STATE_DTYPE)
+
+        self.keyframe_turns.append(turn)
+        self.keyframe_offsets.append(self.file.tell())
+        self.file.write(RECORD.pack(KEYFRAME, turn))
+        self.file.write(state.tobytes())
+
+    def write_turn(self, turn: int, actions: Dict[str, np.ndarray]):
+        """
+        Writes the actions of a turn, given as GameLog columns.
+        """
+        rows = np.zeros(len(actions['action_type']), dtype=ACTION_DTYPE)
+
+        for name in ACTION_DTYPE.names:
+            rows[name] = actions[name]
+
+        self.turn_offsets.append(self.file.tell())
+        self.file.write(RECORD.pack(TURN, turn))
+        self.file.write(COUNT.pack(len(rows)))
+        self.file.write(rows.tobytes())
+
+    def truncate(self, turn: int):
+        """
+        Drops the records of a turn and the following ones,
+        when the game is restored to an earlier turn.
+        """
+        if turn >= len(self.turn_offsets):
+            return
+
+        offset = self.turn_offsets[turn]
+
+        while self.keyframe_turns and self.keyframe_turns[-1] >= turn:
+            offset = min(offset, self.keyframe_offsets.pop())
+            self.keyframe_turns.pop()
+
+        del self.turn_offsets[turn:]
+        self.file.seek(offset)
+        self.file.truncate()
+
+    def close(self):
+        """
+        Writes the index and closes the file.
+        """
+        if self.file.closed:
+            return
+
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.turn_offsets, dtype='<u8').tobytes())
+        keyframe_index_offset = self.file.tell()
+        self.file.write(np.array(self.keyframe_turns, dtype='<u4').tobytes())
+        self.file.write(np.array(self.keyframe_offsets, dtype='<u8').tobytes())
+        self.file.write(TRAILER.pack(index_offset, keyframe_index_offset, len(self.turn_offsets),
+                                     len(self.keyframe_turns), INDEX_MAGIC))
+        self.file.close()
+
+
+@dataclass
+class ReplayState:
+    """
+    State of the units at the start of a turn of a replay, indexed by unit id - 1.
+    """
+    turn: int
+    x: np.ndarray
+    y: np.ndarray
+    health: np.ndarray
+    movement_cooldown: np.ndarray
+    attack_cooldown: np.ndarray
+    # Unit id in each cell, or EMPTY.
+    occupancy: np.ndarray
+
+    @property
+    def alive(self) -> np.ndarray:
+        return self.health > 0
+
+
+class ReplayReader:
+    """
+    Reads a replay file through a memory map.
+
+    The state of any turn is rebuilt from the closest keyframe before it
+    by replaying the actions of the turns in between with the game rules,
+    so seeking costs one keyframe and at most keyframe_interval turns.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, width, height, num_units, self.keyframe_interval = HEADER.unpack_from(self.buffer, 0)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a replay file of version {VERSION}")
+
+        self.width, self.height, self.num_units = width, height, num_units
+        offset = HEADER.size
+        obstacle_bytes = (width * height + 7) // 8
+        bits = np.frombuffer(self.buffer, dtype=np.uint8, count=obstacle_bytes, offset=offset)
+        self.obstacle_map = np.unpackbits(bits, count=width * height).reshape(width, height).astype(bool)
+        offset += obstacle_bytes
+        self.units = np.frombuffer(self.buffer, dtype=UNIT_DTYPE, count=num_units, offset=offset)
+        self.records_offset = offset + UNIT_DTYPE.itemsize * num_units
+
+        self.teams = self.units['team'].astype(np.int8)
+        unit_types = [UNIT_TYPES[code.decode()] for code in self.units['unit_type'].tolist()]
+        self.attack = np.array([t.ATTACK for t in unit_types], dtype=np.int32)
+        self.attack_cooldown = np.array([t.ATTACK_COOLDOWN for t in unit_types], dtype=np.float64)
+        self.movement_cooldown = np.array([t.MOVEMENT_COOLDOWN for t in unit_types], dtype=np.float64)
+
+        self.turn_offsets, self.keyframe_turns, self.keyframe_offsets = self.read_index()
+
+    def read_index(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if len(self.buffer) >= self.records_offset + TRAILER.size:
+            index_offset, keyframe_index_offset, num_turns, num_keyframes, magic = TRAILER.unpack_from(
+                self.buffer, len(self.buffer) - TRAILER.size)
+
+            if magic == INDEX_MAGIC:
+                turn_offsets = np.frombuffer(self.buffer, dtype='<u8', count=num_turns, offset=index_offset)
+                keyframe_turns = np.frombuffer(self.buffer, dtype='<u4', count=num_keyframes,
+                                               offset=keyframe_index_offset)
+                keyframe_offsets = np.frombuffer(self.buffer, dtype='<u8', count=num_keyframes,
+                                                 offset=keyframe_index_offset + 4 * num_keyframes)
+                return turn_offsets, keyframe_turns, keyframe_offsets
+
+        return self.scan_index()
+
+    def scan_index(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Builds the index of a replay that was not closed by walking its records.
+        """
+        turn_offsets, keyframe_turns, keyframe_offsets = [], [], []
+        offset = self.records_offset
+        state_size = STATE_DTYPE.itemsize * self.num_units
+
+        while offset + RECORD.size <= len(self.buffer):
+            tag, turn = RECORD.unpack_from(self.buffer, offset)
+
+            if tag == KEYFRAME and offset + RECORD.size + state_size <= len(self.buffer):
+                keyframe_turns.append(turn)
+                keyframe_offsets.append(offset)
+                offset += RECORD.size + state_size
+            elif tag == TURN and offset + RECORD.size + COUNT.size <= len(self.buffer):
+                count, = COUNT.unpack_from(self.buffer, offset + RECORD.size)
+                end = offset + RECORD.size + COUNT.size + ACTION_DTYPE.itemsize * count
+
+                if end > len(self.buffer):
+                    break
+
+                turn_offsets.append(offset)
+                offset = end
+            else:
+                break
+
+        return (np.array(turn_offsets, dtype=np.uint64), np.array(keyframe_turns, dtype=np.uint32),
+                np.array(keyframe_offsets, dtype=np.uint64))
+
+    @property
+    def num_turns(self) -> int:
+        """
+        The number of turns played, the last state is that of the start of turn num_turns.
+        """
+        return len(self.turn_offsets)
+
+    def get_actions(self, turn: int) -> np.ndarray:
+        """
+        Returns the actions of a turn as a read-only view of the file, with the columns of a GameLog.
+        """
+        offset = int(self.turn_offsets[turn]) + RECORD.size
+        count, = COUNT.unpack_from(self.buffer, offset)
+        return np.frombuffer(self.buffer, dtype=ACTION_DTYPE, count=count, offset=offset + COUNT.size)
+
+    @staticmethod
+    def empty_actions() -> np.ndarray:
+        """
+        Returns no actions, in the form of get_actions, for the state before the first turn.
+        """
+        return np.zeros(0, dtype=ACTION_DTYPE)
+
+    def get_keyframe(self, index: int) -> ReplayState:
+        offset = int(self.keyframe_offsets[index])
+        _, turn = RECORD.unpack_from(self.buffer, offset)
+        rows = np.frombuffer(self.buffer, dtype=STATE_DTYPE, count=self.num_units, offset=offset + RECORD.size)
+        state = ReplayState(turn, rows['x'].astype(np.int32), rows['y'].astype(np.int32),
+                            rows['health'].astype(np.int32), rows['movement_cooldown'].copy(),
+                            rows['attack_cooldown'].copy(),
+                            np.full((self.width, self.height), EMPTY, dtype=np.int32))
+        alive = state.alive
+        state.occupancy[state.x[alive], state.y[alive]] = np.flatnonzero(alive) + 1
+        return state
+
+    def get_state(self, turn: int) -> ReplayState:
+        """
+        Returns the state of the units at the start of a turn.
+        """
+        if turn < 0 or turn > self.num_turns:
+            raise IndexError(f"Turn {turn} is not in the replay")
+
+        index = int(np.searchsorted(self.keyframe_turns, turn, side='right')) - 1
+        state = self.get_keyframe(index)
+
+        while state.turn < turn:
+            self.apply_turn(state, self.get_actions(state.turn))
+
+        return state
+
+    def apply_turn(self, state: ReplayState, actions: np.ndarray):
+        """
+        Advances a state by a turn, replaying its actions like WorldManager.play_turn:
+        units that are alive start their turn in order of id, then play their actions.
+        """
+        unit_ids = actions['unit_id'].tolist()
+        action_types = actions['action_type'].tolist()
+        target_xs, target_ys = actions['target_x'].tolist(), actions['target_y'].tolist()
+        health = state.health
+        next_action = 0
+
+        for unit in range(self.num_units):
+            if health[unit] <= 0:
+                continue
+
+            state.movement_cooldown[unit] = max(0.0, state.movement_cooldown[unit] - 1.0)
+            state.attack_cooldown[unit] = max(0.0, state.attack_cooldown[unit] - 1.0)
+
+            while next_action < len(unit_ids) and unit_ids[next_action] == unit + 1:
+                x, y = target_xs[next_action], target_ys[next_action]
+
+                if action_types[next_action] == GameActionType.MOVE.value:
+                    state.occupancy[state.x[unit], state.y[unit]] = EMPTY
+                    state.occupancy[x, y] = unit + 1
+                    state.x[unit], state.y[unit] = x, y
+                    state.movement_cooldown[unit] += self.movement_cooldown[unit]
+                elif action_types[next_action] == GameActionType.ATTACK.value:
+                    victim = state.occupancy[x, y] - 1
+
+                    if victim >= 0:
+                        health[victim] = max(0, health[victim] - self.attack[unit])
+
+                        if health[victim] == 0:
+                            state.occupancy[x, y] = EMPTY
+
+                    state.attack_cooldown[unit] += self.attack_cooldown[unit]
+
+                next_action += 1
+
+        state.turn += 1
+
+    def team_map(self, state: ReplayState) -> np.ndarray:
+        """
+        Returns the team value of the unit in each cell, or NO_TEAM, like World.team_map.
+        """
+        team_map = np.full((self.width, self.height), NO_TEAM, dtype=np.int8)
+        occupied = state.occupancy != EMPTY
+        team_map[occupied] = self.teams[state.occupancy[occupied] - 1]
+        return team_map
+
+    def close(self):
+        try:
+            self.buffer.close()
+        except BufferError:
+            # Some views of the file are still alive, it is unmapped with them.
+            pass
@@ -0,0 +1,95 @@
+import math
+
+from typing import Dict, List, Tuple
+
+from .location import Location
+from .unit import Unit
+
+
+class SpatialIndex:
+    """
+    Uniform grid that buckets units by location so that range queries only
+    look at the units in the buckets overlapping the queried disc.
+    """
+
+    def __init__(self, bucket_size: int = 8):
+        self.bucket_size = bucket_size
+        self.buckets: Dict[Tuple[int, int], Dict[int, Unit]] = {}
+
+    def bucket_of(self, location: Location) -> Tuple[int, int]:
+        return location.x // self.bucket_size, location.y // self.bucket_size
+
+    def clear(self):
+        self.buckets.clear()
+
+    def insert(self, unit: Unit):
+        """
+        Adds a unit to the bucket of its current location.
+        """
+        self.buckets.setdefault(self.bucket_of(unit.location), {})[unit.id] = unit
+
+    def remove(self, unit: Unit):
+        """
+        Removes a unit from the bucket of its current location.
+        """
+        key = self.bucket_of(unit.location)
+        bucket = self.buckets.get(key)
+
+        if bucket is None:
+            return
+
+        bucket.pop(unit.id, None)
+
+        if not bucket:
+            del self.buckets[key]
+
+    def move(self, unit: Unit, old_location: Location):
+        """
+        Moves a unit that was at old_location to the bucket of its current location.
+        """
+        old_key = self.bucket_of(old_location)
+        new_key = self.bucket_of(unit.location)
+
+        if old_key == new_key:
+            return
+
+        bucket = self.buckets[old_key]
+        del bucket[unit.id]
+
+        if not bucket:
+            del self.buckets[old_key]
+
+        self.buckets.setdefault(new_key, {})[unit.id] = unit
+
+    def query(self, location: Location, range_squared: int) -> List[Unit]:
+        """
+        Returns the units within range_squared of a location, ordered by id.
+        """
+        size = self.bucket_size
+        x, y = location.x, location.y
+        radius = math.isqrt(range_squared)
+        units = []
+
+        for bx in range((x - radius) // size, (x + radius) // size + 1):
+            # Distance along x from the location to the closest column of the bucket.
+            dx = max(bx * size - x, 0, x - (bx * size + size - 1))
+
+            for by in range((y - radius) // size, (y + radius) // size + 1):
+                bucket = self.buckets.get((bx, by))
+
+                if bucket is None:
+                    continue
+
+                dy = max(by * size - y, 0, y - (by * size + size - 1))
+
+                if dx * dx + dy * dy > range_squared:
+                    continue
+
+                for unit in bucket.values():
+                    ux, uy = unit.location.x - x, unit.location.y - y
+
+                    if ux * ux + uy * uy <= range_squared:
+                        units.append(unit)
+
+        units.sort(key=lambda unit: unit.id)
+        return units
@@ -45,10 +45,9 @@ class Unit:
         return self.unit_type.ATTACK_COOLDOWN
 
     def start_turn(self):
-        self.current_movement_cooldown = max(
-            0.0, self.current_movement_cooldown - 1.0)
-        self.current_attack_cooldown = max(
-            0.0, self.current_attack_cooldown - 1.0)
+        self.world.set_unit_cooldowns(self,
+                                      max(0.0, self.current_movement_cooldown - 1.0),
+                                      max(0.0, self.current_attack_cooldown - 1.0))
 
     def run(self):
         pass
@@ -61,7 +60,7 @@ class Unit:
         pass
 
     def receive_damage(self, damage: int):
-        self.health = max(0, self.health - damage)
+        self.world.set_unit_health(self, max(0, self.health - damage))
 
         if self.health == 0:
             self.kill()
@@ -91,7 +90,8 @@ class Unit:
         return (self.can_move() and not self.world.is_occupied(new_location))
 
     def add_movement_cooldown(self):
-        self.current_movement_cooldown += self.movement_cooldown
+        self.world.set_unit_cooldowns(self, self.current_movement_cooldown + self.movement_cooldown,
+                                      self.current_attack_cooldown)
 
     def can_attack(self) -> bool:
         return self.current_attack_cooldown < 1.0
@@ -103,7 +103,8 @@ class Unit:
         return self.is_in_range(location) and self.can_attack()
 
     def add_attack_cooldown(self):
-        self.current_attack_cooldown += self.attack_cooldown
+        self.world.set_unit_cooldowns(self, self.current_movement_cooldown,
+                                      self.current_attack_cooldown + self.attack_cooldown)
 
     def __eq__(self, other) -> bool:
         return self.id == other.id
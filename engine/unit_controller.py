@@ -2,7 +2,7 @@ import logging
 from abc import ABC
 from typing import List, Optional
 from .direction import Direction
-from .game_log import GameAction, GameActionType, GameLog
+from .game_log import GameActionType, GameLog
 from .location import Location
 from .unit import Unit
 
@@ -17,23 +17,21 @@ class UnitController(ABC):
         return self.unit.location
 
     def move(self, direction: Direction):
-        logging.debug(
-            f'{self.unit.id} at {self.unit.location} is trying to move {direction}')
+        logging.debug('%s at %s is trying to move %s', self.unit.id, self.unit.location, direction)
 
         if self.unit.can_move_to_direction(direction):
             target_location = self.unit.location.add_direction(direction)
-            self.game_log.add_action(GameAction(
-                GameActionType.MOVE, self.unit.id, self.unit.location, target_location))
+            self.game_log.log_action(
+                GameActionType.MOVE, self.unit.id, self.unit.location, target_location)
             self.world.move_unit(self.unit, direction)
             self.unit.add_movement_cooldown()
 
     def attack(self, location: Location):
-        logging.debug(
-            f'{self.unit.id} at {self.unit.location} is trying to attack {location}')
+        logging.debug('%s at %s is trying to attack %s', self.unit.id, self.unit.location, location)
 
         if self.unit.can_attack_location(location):
-            self.game_log.add_action(GameAction(
-                GameActionType.ATTACK, self.unit.id, self.unit.location, location))
+            self.game_log.log_action(
+                GameActionType.ATTACK, self.unit.id, self.unit.location, location)
             cell = self.world.get_cell(location)
             cell.hit(self.unit)
             self.unit.add_attack_cooldown()
@@ -42,42 +40,16 @@ class UnitController(ABC):
         return self.world.get_unit_at_location(location)
 
     def sense_units(self) -> List[Unit]:
-        units = []
-
-        for unit in self.world.units:
-            if unit == self.unit:
-                continue
-
-            if self.unit.location.distance_squared(unit.location) <= self.unit.vision_range:
-                units.append(unit)
-
-        return units
+        return [unit for unit in self.world.get_units_in_range(self.unit.location, self.unit.vision_range)
+                if unit != self.unit]
 
     def sense_ally_units(self) -> List[Unit]:
-        units = []
-
-        for unit in self.world.units:
-            if unit == self.unit:
-                continue
-
-            if (unit.team == self.unit.team
-                    and self.unit.location.distance_squared(unit.location) <= self.unit.vision_range):
-                units.append(unit)
-
-        return units
+        return [unit for unit in self.world.get_units_in_range(self.unit.location, self.unit.vision_range)
+                if unit != self.unit and unit.team == self.unit.team]
 
     def sense_enemy_units(self) -> List[Unit]:
-        units = []
-
-        for unit in self.world.units:
-            if unit == self.unit:
-                continue
-
-            if (unit.team != self.unit.team
-                    and self.unit.location.distance_squared(unit.location) <= self.unit.vision_range):
-                units.append(unit)
-
-        return units
+        return [unit for unit in self.world.get_units_in_range(self.unit.location, self.unit.vision_range)
+                if unit != self.unit and unit.team != self.unit.team]
 
     def sense_obstacles(self) -> List[Location]:
         obstacles = []
@@ -89,5 +61,7 @@ class UnitController(ABC):
         return obstacles
 
     def get_visible_locations(self) -> List[Location]:
-        return [cell.location for row in self.world.grid for cell in row
-                if self.unit.can_sense_location(cell.location)]
\ No newline at end of file
+        return self.world.get_visible_locations(self.unit.location, self.unit.unit_type)
+
+    def get_attackable_locations(self) -> List[Location]:
+        return self.world.get_attackable_locations(self.unit.location, self.unit.unit_type)
\ No newline at end of file
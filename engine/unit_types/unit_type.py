@@ -1,3 +1,25 @@
+import functools
+import math
+
+import numpy as np
+
+
+@functools.lru_cache(maxsize=None)
+def disc_stencil(range_squared: int) -> np.ndarray:
+    """
+    Returns the (dx, dy) offsets within range_squared of the origin,
+    sorted by dx and then by dy. The result is cached and read-only.
+    """
+    radius = math.isqrt(range_squared)
+    offsets = [(dx, dy)
+               for dx in range(-radius, radius + 1)
+               for dy in range(-radius, radius + 1)
+               if dx * dx + dy * dy <= range_squared]
+    stencil = np.array(offsets, dtype=np.int32).reshape(-1, 2)
+    stencil.setflags(write=False)
+    return stencil
+
+
 class UnitType:
     """
     Class for unit types.
@@ -15,4 +37,18 @@ class UnitType:
         """
         Get unit type.
         """
-        return cls.__name__
\ No newline at end of file
+        return cls.__name__
+
+    @classmethod
+    def vision_stencil(cls) -> np.ndarray:
+        """
+        Get the offsets of the cells this unit type can see.
+        """
+        return disc_stencil(cls.VISION_RANGE)
+
+    @classmethod
+    def attack_stencil(cls) -> np.ndarray:
+        """
+        Get the offsets of the cells this unit type can attack.
+        """
+        return disc_stencil(cls.ATTACK_RANGE)
@@ -0,0 +1,204 @@
+import numpy as np
+
+from typing import List, Optional, Tuple
+from .direction import Direction
+from .map_loader import load_map_template
+from .team import Team
+from .unit_types.unit_type import UnitType
+
+
+NO_WINNER = -1
+
+# Features of each unit in the observation array.
+OBS_X = 0
+OBS_Y = 1
+OBS_HEALTH = 2
+OBS_ALIVE = 3
+OBS_MOVEMENT_COOLDOWN = 4
+OBS_ATTACK_COOLDOWN = 5
+OBS_FEATURES = 6
+
+# Offsets of the directions, indexed like Direction.DIRECTIONS.
+DIRECTION_DX = np.array([dx for dx, _ in Direction.DIRECTIONS], dtype=np.int32)
+DIRECTION_DY = np.array([dy for _, dy in Direction.DIRECTIONS], dtype=np.int32)
+NO_MOVE = Direction.DIRECTIONS.index(Direction.ZERO)
+NO_ATTACK = -1
+
+
+class VecWorld:
+    """
+    Runs num_envs independent games of the same map in lockstep.
+
+    The state of every game is stored in arrays whose first axis is the game.
+    Units are indexed in the order they appear in the map file and act in that
+    order, like in WorldManager, using the rules of their UnitType:
+    - A unit first moves in the direction given by its move action
+      (an index into Direction.DIRECTIONS, NO_MOVE to stay).
+    - Then it attacks the location of the unit given by its attack action
+      (a unit index, NO_ATTACK to skip).
+
+    Games that end are reset automatically at the end of the step.
+    """
+
+    def __init__(self, map_file: str, num_envs: int, max_turns: int):
+        self.num_envs = num_envs
+        self.max_turns = max_turns
+        template = load_map_template(map_file)
+        self.width = template.width
+        self.height = template.height
+        self.obstacle_map = template.obstacle_map
+        self.unit_types: List[UnitType] = [map_unit.unit_type for map_unit in template.units]
+        self.initial_x = np.array([map_unit.x for map_unit in template.units], dtype=np.int32)
+        self.initial_y = np.array([map_unit.y for map_unit in template.units], dtype=np.int32)
+
+        num_units = len(self.unit_types)
+        self.num_units = num_units
+        self.team = np.array([map_unit.team.value for map_unit in template.units], dtype=np.int8)
+        self.attack = np.array([t.ATTACK for t in self.unit_types], dtype=np.int32)
+        self.attack_range = np.array([t.ATTACK_RANGE for t in self.unit_types], dtype=np.int32)
+        self.attack_cooldown = np.array([t.ATTACK_COOLDOWN for t in self.unit_types], dtype=np.float64)
+        self.movement_cooldown = np.array([t.MOVEMENT_COOLDOWN for t in self.unit_types], dtype=np.float64)
+        self.max_health = np.array([t.MAX_HEALTH for t in self.unit_types], dtype=np.int32)
+
+        self.x = np.zeros((num_envs, num_units), dtype=np.int32)
+        self.y = np.zeros((num_envs, num_units), dtype=np.int32)
+        self.health = np.zeros((num_envs, num_units), dtype=np.int32)
+        self.alive = np.zeros((num_envs, num_units), dtype=bool)
+        self.current_movement_cooldown = np.zeros((num_envs, num_units), dtype=np.float64)
+        self.current_attack_cooldown = np.zeros((num_envs, num_units), dtype=np.float64)
+        # Index of the unit in each cell plus one, 0 if the cell is empty.
+        self.occupancy = np.zeros((num_envs, self.width, self.height), dtype=np.int32)
+        self.turn = np.zeros(num_envs, dtype=np.int32)
+        self.observations = np.zeros((num_envs, num_units, OBS_FEATURES), dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.winners = np.full(num_envs, NO_WINNER, dtype=np.int8)
+        self._env_index = np.arange(num_envs)
+
+        self.reset()
+
+    def reset(self, env_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Resets some games, or all of them, to the initial state of the map.
+
+        Args:
+            env_ids: The indices of the games to reset. All games if None.
+
+        Returns:
+            The observations of all games.
+        """
+        if env_ids is None:
+            env_ids = self._env_index
+
+        xs, ys = self.initial_x, self.initial_y
+        self.x[env_ids] = xs
+        self.y[env_ids] = ys
+        self.health[env_ids] = self.max_health
+        self.alive[env_ids] = True
+        self.current_movement_cooldown[env_ids] = self.movement_cooldown
+        self.current_attack_cooldown[env_ids] = self.attack_cooldown
+        self.occupancy[env_ids] = 0
+        self.occupancy[np.asarray(env_ids)[:, None], xs, ys] = np.arange(1, self.num_units + 1)
+        self.turn[env_ids] = 0
+
+        return self.observe()
+
+    def observe(self) -> np.ndarray:
+        """
+        Writes the state of every unit into the observation buffer.
+
+        Returns:
+            An array of shape (num_envs, num_units, OBS_FEATURES) that is reused between calls.
+        """
+        obs = self.observations
+        obs[:, :, OBS_X] = self.x
+        obs[:, :, OBS_Y] = self.y
+        obs[:, :, OBS_HEALTH] = self.health / self.max_health
+        obs[:, :, OBS_ALIVE] = self.alive
+        obs[:, :, OBS_MOVEMENT_COOLDOWN] = self.current_movement_cooldown
+        obs[:, :, OBS_ATTACK_COOLDOWN] = self.current_attack_cooldown
+        return obs
+
+    def step(self, moves: np.ndarray, attacks: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Plays one turn of every game.
+
+        Args:
+            moves: Direction index of every unit, of shape (num_envs, num_units).
+            attacks: Target unit index of every unit, of shape (num_envs, num_units).
+
+        Returns:
+            The observations, which games ended this turn and their winners
+            (a Team value, or NO_WINNER for draws). Ended games are reset,
+            so their observations are those of the new game.
+        """
+        envs = self._env_index
+
+        for u in range(self.num_units):
+            alive = self.alive[:, u]
+
+            # Start of the unit's turn
+            np.maximum(self.current_movement_cooldown[:, u] - 1.0, 0.0,
+                       out=self.current_movement_cooldown[:, u])
+            np.maximum(self.current_attack_cooldown[:, u] - 1.0, 0.0,
+                       out=self.current_attack_cooldown[:, u])
+
+            # Move
+            direction = moves[:, u]
+            x, y = self.x[:, u], self.y[:, u]
+            nx = x + DIRECTION_DX[direction]
+            ny = y + DIRECTION_DY[direction]
+            inside = (nx >= 0) & (nx < self.width) & (ny >= 0) & (ny < self.height)
+            nx = np.clip(nx, 0, self.width - 1)
+            ny = np.clip(ny, 0, self.height - 1)
+            can_move = (alive & inside
+                        & (self.current_movement_cooldown[:, u] < 1.0)
+                        & ~self.obstacle_map[nx, ny]
+                        & (self.occupancy[envs, nx, ny] == 0))
+            movers = np.flatnonzero(can_move)
+
+            if len(movers) > 0:
+                self.occupancy[movers, x[movers], y[movers]] = 0
+                self.occupancy[movers, nx[movers], ny[movers]] = u + 1
+                self.x[movers, u] = nx[movers]
+                self.y[movers, u] = ny[movers]
+                self.current_movement_cooldown[movers, u] += self.movement_cooldown[u]
+
+            # Attack
+            target = attacks[:, u]
+            has_target = target != NO_ATTACK
+            target = np.where(has_target, target, 0)
+            dx = self.x[envs, target] - self.x[:, u]
+            dy = self.y[envs, target] - self.y[:, u]
+            can_attack = (alive & has_target
+                          & self.alive[envs, target]
+                          & (self.current_attack_cooldown[:, u] < 1.0)
+                          & (dx * dx + dy * dy <= self.attack_range[u]))
+            attackers = np.flatnonzero(can_attack)
+
+            if len(attackers) > 0:
+                victims = target[attackers]
+                health = np.maximum(self.health[attackers, victims] - self.attack[u], 0)
+                self.health[attackers, victims] = health
+                self.current_attack_cooldown[attackers, u] += self.attack_cooldown[u]
+
+                killed = health == 0
+                killed_envs, killed_units = attackers[killed], victims[killed]
+                self.alive[killed_envs, killed_units] = False
+                self.occupancy[killed_envs,
+                               self.x[killed_envs, killed_units],
+                               self.y[killed_envs, killed_units]] = 0
+
+        self.turn += 1
+
+        # If there are only units from one team left, the game is over.
+        red_alive = (self.alive & (self.team == Team.RED.value)).any(axis=1)
+        blue_alive = (self.alive & (self.team == Team.BLUE.value)).any(axis=1)
+        self.winners[:] = NO_WINNER
+        self.winners[~red_alive] = Team.BLUE.value
+        self.winners[red_alive & ~blue_alive] = Team.RED.value
+        np.logical_or(self.winners != NO_WINNER, self.turn >= self.max_turns, out=self.dones)
+
+        if self.dones.any():
+            self.reset(np.flatnonzero(self.dones))
+
+        return self.observe(), self.dones, self.winners
@@ -1,24 +1,99 @@
-import pygame
+import hashlib
 
-from typing import List, Optional
+import numpy as np
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
 from .cell import Cell
 from .direction import Direction
 from .location import Location
+from .map_loader import MapTemplate, load_map_template
+from .spatial_index import SpatialIndex
 from .team import Team
 from .unit import Unit
-from .unit_types.archer import Archer
+from .unit_types.unit_type import UnitType
+
+
+EMPTY = 0
+NO_TEAM = -1
+
+# Parts of the state that make up the Zobrist hash of a world.
+HASH_MAP = 0
+HASH_LOCATION = 1
+HASH_HEALTH = 2
+HASH_MOVEMENT_COOLDOWN = 3
+HASH_ATTACK_COOLDOWN = 4
+HASH_MASK = (1 << 64) - 1
+
+
+def zobrist_key(*values) -> int:
+    """
+    Returns the 64-bit key of a feature of the state, such as
+    (HASH_LOCATION, unit id, x, y).
+
+    Keys are computed on demand instead of being drawn from tables, since
+    the hash of a tuple of numbers is well mixed and, unlike the hash of
+    strings or bytes, the same in every process.
+    """
+    return hash(values) & HASH_MASK
+
+
+def unit_key(unit: Unit) -> int:
+    """
+    Returns the XOR of the keys of the location, health and cooldowns of a unit.
+    """
+    return (zobrist_key(HASH_LOCATION, unit.id, unit.location.x, unit.location.y)
+            ^ zobrist_key(HASH_HEALTH, unit.id, unit.health)
+            ^ zobrist_key(HASH_MOVEMENT_COOLDOWN, unit.id, unit.current_movement_cooldown)
+            ^ zobrist_key(HASH_ATTACK_COOLDOWN, unit.id, unit.current_attack_cooldown))
+
+
+@dataclass(frozen=True)
+class WorldSnapshot:
+    """
+    Compact copy of the mutable state of a world.
+
+    The Unit objects are shared with the world; their location, health and
+    cooldowns are stored in unit_state, one row per unit.
+    """
+    occupancy: np.ndarray
+    team_map: np.ndarray
+    units: Tuple[Unit, ...]
+    unit_state: np.ndarray
+    unit_id: int
+    state_hash: int
 
 
 class World:
     """
     A class that represents the world.
+
+    The map is stored as dense arrays indexed by [x, y]:
+    - obstacle_map: True where the cell holds an obstacle.
+    - occupancy: the id of the unit in the cell, or EMPTY.
+    - team_map: the team value of the unit in the cell, or NO_TEAM.
+
+    The world keeps a 64-bit Zobrist hash of its state in state_hash: the
+    XOR of a key for the map and keys for the location, health and cooldowns
+    of every unit. It is updated in O(1) whenever a unit is added, moved,
+    damaged or removed or its cooldowns change, so the health and cooldowns
+    of units must be changed through set_unit_health and set_unit_cooldowns.
     """
 
     def __init__(self, map_file: str, world_manager: 'WorldManager'):
         self.width: int = 0
         self.height: int = 0
-        self.grid: List[List[Cell]] = []
+        self.obstacle_map: np.ndarray = np.zeros((0, 0), dtype=bool)
+        self.occupancy: np.ndarray = np.zeros((0, 0), dtype=np.int32)
+        self.team_map: np.ndarray = np.zeros((0, 0), dtype=np.int8)
         self.obstacles: List[Location] = []
+        self.units_by_id: Dict[int, Unit] = {}
+        self.spatial_index = SpatialIndex()
+        # Counters of the changes made to the units since the world was created.
+        self.moves = 0
+        self.damage_dealt = 0
+        self.state_hash = 0
+        self.__grid: Optional[List[List[Cell]]] = None
         self.__unit_id = 0
         self.world_manager = world_manager
         self.load_map(map_file)
@@ -27,67 +102,64 @@ class World:
     def units(self) -> list:
         return self.world_manager.units
 
-    def load_map(self, map_file: str):
+    @property
+    def grid(self) -> List[List[Cell]]:
+        """
+        Cell views of the map, indexed by [x][y].
+        They are only built the first time they are requested.
+        """
+        if self.__grid is None:
+            self.__grid = [[Cell(self, Location.at(x, y))
+                            for y in range(self.height)] for x in range(self.width)]
+
+        return self.__grid
+
+    def allocate_grid(self, width: int, height: int):
+        """
+        Allocates an empty map of the given size.
         """
-        Loads a map from a file.
+        self.width = width
+        self.height = height
+        self.obstacle_map = np.zeros((width, height), dtype=bool)
+        self.occupancy = np.full((width, height), EMPTY, dtype=np.int32)
+        self.team_map = np.full((width, height), NO_TEAM, dtype=np.int8)
+        Location.intern_grid(width, height)
+        self.units_by_id.clear()
+        self.spatial_index.clear()
+        self.__grid = None
+        self.state_hash = 0
 
-        The file should be a text file with the following format:
-        - The first line should be the width and height of the map.
-        - The following lines are the locations of obstacles and units.
-            The first character of each line is either 'O' (obstacle) or 'U' (unit).
-            The second character is the x-coordinate of the location.
-            The third character is the y-coordinate of the location.
-            The fourth character is the team of the unit.
-            The fifth character is the unit type of the unit.
+    def load_map(self, map_file: str):
+        """
+        Loads a map from a file. See map_loader.parse_map for the format.
 
         Args:
-            map_file: The file to load the map from.         
-        """
-        # TODO: move to map_loader.py
-        with open(map_file, 'r', encoding="utf-8") as f:
-            lines = f.readlines()
-            width, height = [int(x) for x in lines[0].split()]
-            self.width = width
-            self.height = height
-            self.grid = [[Cell(Location(x, y))
-                          for y in range(height)] for x in range(width)]
-
-            for line in lines[1:]:
-                line = line.strip().split()
-
-                if line[0] == 'O':
-                    self.grid[int(line[1])][int(line[2])].add_obstacle()
-                    self.obstacles.append(Location(int(line[1]), int(line[2])))
-                elif line[0] == 'U':
-                    unit_type = line[4]
-                    team = line[3]
-                    location = Location(int(line[1]), int(line[2]))
-
-                    if unit_type == 'A':
-                        unit_type = Archer
-                    else:
-                        raise Exception("Unknown unit type: " + unit_type)
-
-                    if team == 'R':
-                        team = Team.RED
-                    elif team == 'B':
-                        team = Team.BLUE
-                    elif team == 'N':
-                        team = Team.NEUTRAL
-                    else:
-                        raise Exception("Unknown team: " + team)
-
-                    new_unit = Unit(unit_type, team, location, self, self.world_manager)
-                    self.world_manager.add_unit(new_unit, self)
+            map_file: The file to load the map from.
+        """
+        self.load_template(load_map_template(map_file))
+
+    def load_template(self, template: MapTemplate):
+        """
+        Builds the map and adds the units of a parsed map.
+        """
+        self.allocate_grid(template.width, template.height)
+        self.obstacle_map[:] = template.obstacle_map
+        self.state_hash = self.map_key()
+        self.obstacles = [Location.at(x, y) for x, y in template.obstacles]
+
+        for map_unit in template.units:
+            location = Location.at(map_unit.x, map_unit.y)
+            new_unit = Unit(map_unit.unit_type, map_unit.team, location, self, self.world_manager)
+            self.world_manager.add_unit(new_unit, self)
 
     def get_cell(self, location: Location) -> Cell:
-        return self.grid[location.x][location.y]
+        return Cell(self, location)
 
     def has_obstacle(self, location: Location) -> bool:
         """
         Checks if a location has an obstacle.
         """
-        return self.grid[location.x][location.y].has_obstacle()
+        return bool(self.obstacle_map[location.x, location.y])
 
     def is_out_of_bounds(self, location: Location) -> bool:
         """
@@ -124,19 +196,90 @@ class World:
         Returns:
             True if the location is occupied, False otherwise.
         """
-        return self.grid[location.x][location.y].get_unit() is not None
+        return bool(self.occupancy[location.x, location.y] != EMPTY)
 
     def add_unit(self, unit: Unit, location: Location):
         """
         Adds a unit at a location.
         """
-        self.grid[location.x][location.y].set_unit(unit)
+        self.place_unit(unit, location)
+        self.spatial_index.insert(unit)
+        self.state_hash ^= unit_key(unit)
+
+    def place_unit(self, unit: Unit, location: Location):
+        """
+        Writes a unit into the cell at a location and registers its id.
+        """
+        self.units_by_id[unit.id] = unit
+        self.occupancy[location.x, location.y] = unit.id
+        self.team_map[location.x, location.y] = unit.team.value
+
+    def clear_location(self, location: Location):
+        """
+        Empties the cell at a location.
+        """
+        self.occupancy[location.x, location.y] = EMPTY
+        self.team_map[location.x, location.y] = NO_TEAM
 
     def get_unit_at_location(self, location: Location) -> Optional[Unit]:
         """
         Returns the unit at a location.
         """
-        return self.grid[location.x][location.y].get_unit()
+        unit_id = int(self.occupancy[location.x, location.y])
+
+        if unit_id == EMPTY:
+            return None
+
+        return self.units_by_id[unit_id]
+
+    def get_unit_by_id(self, unit_id: int) -> Optional[Unit]:
+        """
+        Returns the unit with the given id, or None if it is not in the world.
+        """
+        return self.units_by_id.get(unit_id)
+
+    def get_team_mask(self, team: Team) -> np.ndarray:
+        """
+        Returns a boolean map of the cells occupied by units of a team.
+        """
+        return self.team_map == team.value
+
+    def stencil_cells(self, location: Location, stencil: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Centers a stencil of (dx, dy) offsets at a location.
+
+        Returns:
+            The x and y coordinates of every stencil cell and a mask of the ones inside the map.
+        """
+        xs = stencil[:, 0] + location.x
+        ys = stencil[:, 1] + location.y
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        return xs, ys, inside
+
+    def get_stencil_locations(self, location: Location, stencil: np.ndarray) -> List[Location]:
+        """
+        Returns the locations of a stencil centered at a location, clipped to the map.
+        """
+        xs, ys, inside = self.stencil_cells(location, stencil)
+        return [Location.at(x, y) for x, y in zip(xs[inside].tolist(), ys[inside].tolist())]
+
+    def get_visible_locations(self, location: Location, unit_type: UnitType) -> List[Location]:
+        """
+        Returns the locations a unit of the given type can see from a location.
+        """
+        return self.get_stencil_locations(location, unit_type.vision_stencil())
+
+    def get_attackable_locations(self, location: Location, unit_type: UnitType) -> List[Location]:
+        """
+        Returns the locations a unit of the given type can attack from a location.
+        """
+        return self.get_stencil_locations(location, unit_type.attack_stencil())
+
+    def get_units_in_range(self, location: Location, range_squared: int) -> List[Unit]:
+        """
+        Returns the units within range_squared of a location, ordered by id.
+        """
+        return self.spatial_index.query(location, range_squared)
 
     def next_unit_id(self) -> int:
         """
@@ -149,7 +292,12 @@ class World:
         """
         Removes a unit from the world.
         """
-        self.grid[unit.location.x][unit.location.y].set_unit(None)
+        self.clear_location(unit.location)
+
+        if self.units_by_id.pop(unit.id, None) is not None:
+            self.state_hash ^= unit_key(unit)
+
+        self.spatial_index.remove(unit)
 
     def move_unit(self, unit: Unit, direction: Direction):
         """
@@ -161,20 +309,108 @@ class World:
             return
 
         if self.is_accessible(new_location) and not self.is_occupied(new_location):
-            self.grid[unit.location.x][unit.location.y].set_unit(None)
-            self.grid[new_location.x][new_location.y].set_unit(unit)
+            old_location = unit.location
+            self.clear_location(old_location)
+            self.place_unit(unit, new_location)
             unit.location = new_location
+            self.spatial_index.move(unit, old_location)
+            self.moves += 1
+            self.state_hash ^= (zobrist_key(HASH_LOCATION, unit.id, old_location.x, old_location.y)
+                                ^ zobrist_key(HASH_LOCATION, unit.id, new_location.x, new_location.y))
+
+    def set_unit_health(self, unit: Unit, health: int):
+        """
+        Changes the health of a unit.
+        """
+        if health == unit.health:
+            return
+
+        if health < unit.health:
+            self.damage_dealt += unit.health - health
+
+        if unit.id in self.units_by_id:
+            self.state_hash ^= (zobrist_key(HASH_HEALTH, unit.id, unit.health)
+                                ^ zobrist_key(HASH_HEALTH, unit.id, health))
+
+        unit.health = health
+
+    def set_unit_cooldowns(self, unit: Unit, movement_cooldown: float, attack_cooldown: float):
+        """
+        Changes the current cooldowns of a unit.
+        """
+        if unit.id in self.units_by_id:
+            if movement_cooldown != unit.current_movement_cooldown:
+                self.state_hash ^= (
+                    zobrist_key(HASH_MOVEMENT_COOLDOWN, unit.id, unit.current_movement_cooldown)
+                    ^ zobrist_key(HASH_MOVEMENT_COOLDOWN, unit.id, movement_cooldown))
+
+            if attack_cooldown != unit.current_attack_cooldown:
+                self.state_hash ^= (
+                    zobrist_key(HASH_ATTACK_COOLDOWN, unit.id, unit.current_attack_cooldown)
+                    ^ zobrist_key(HASH_ATTACK_COOLDOWN, unit.id, attack_cooldown))
+
+        unit.current_movement_cooldown = movement_cooldown
+        unit.current_attack_cooldown = attack_cooldown
+
+    def map_key(self) -> int:
+        """
+        Returns the key of the size and obstacles of the map.
+        """
+        digest = hashlib.blake2b(self.obstacle_map.tobytes(), digest_size=8).digest()
+        return zobrist_key(HASH_MAP, self.width, self.height, int.from_bytes(digest, 'little'))
+
+    def compute_hash(self) -> int:
+        """
+        Computes the Zobrist hash of the world from scratch. It is equal
+        to state_hash, which is kept up to date incrementally.
+        """
+        state_hash = self.map_key()
+
+        for unit in self.units_by_id.values():
+            state_hash ^= unit_key(unit)
+
+        return state_hash
+
+    def snapshot(self) -> WorldSnapshot:
+        """
+        Captures the units and the occupied cells of the world.
+        Obstacles are not captured since they do not change during a game.
+        """
+        units = tuple(self.units_by_id.values())
+        unit_state = np.array([(unit.location.x, unit.location.y, unit.health,
+                                unit.current_movement_cooldown, unit.current_attack_cooldown)
+                               for unit in units], dtype=np.float64).reshape(-1, 5)
+        return WorldSnapshot(self.occupancy.copy(), self.team_map.copy(),
+                             units, unit_state, self.__unit_id, self.state_hash)
+
+    def restore(self, snapshot: WorldSnapshot):
+        """
+        Restores the world to the state captured by a snapshot.
+        """
+        np.copyto(self.occupancy, snapshot.occupancy)
+        np.copyto(self.team_map, snapshot.team_map)
+        self.units_by_id.clear()
+        self.spatial_index.clear()
+        self.__unit_id = snapshot.unit_id
+        self.state_hash = snapshot.state_hash
+
+        for unit, (x, y, health, movement_cooldown, attack_cooldown) in zip(
+                snapshot.units, snapshot.unit_state.tolist()):
+            unit.location = Location.at(int(x), int(y))
+            unit.health = int(health)
+            unit.current_movement_cooldown = movement_cooldown
+            unit.current_attack_cooldown = attack_cooldown
+            self.units_by_id[unit.id] = unit
+            self.spatial_index.insert(unit)
 
     def print_map(self):
         """
         Prints the map to the console.
         """
-        for row in self.grid:
-            for cell in row:
-                if cell.has_obstacle():
-                    print('O', end='')
-                elif cell.get_unit() is not None:
-                    print(cell.get_unit().team.value, end='')
-                else:
-                    print(' ', end='')
-            print()
+        chars = np.full((self.width, self.height), ' ')
+        occupied = self.occupancy != EMPTY
+        chars[occupied] = self.team_map[occupied].astype(str)
+        chars[self.obstacle_map] = 'O'
+
+        for row in chars:
+            print(''.join(row))
@@ -1,94 +1,409 @@
+import enum
 import logging
-from typing import Any
-from .game_log import GameLog
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from .game_log import GameLog, GameLogMode
+from .map_loader import load_map_template
+from .profiler import GameProfile, ProfiledUnitController, Profiler, brain_name, profile_path, save_profile
+from .replay import ReplayWriter
 from .team import Team
 from .unit import Unit
 from .unit_controller import UnitController
-from .world import World
+from .world import World, WorldSnapshot
 from .unit_player import UnitPlayerBase
 
 
+class GameOutcome(enum.Enum):
+    """Enum for how a game ended."""
+    WIN = 1
+    # The maximum number of turns was reached.
+    DRAW = 2
+    # Stalemate detection ended the game early.
+    STALEMATE = 3
+
+
+@dataclass(frozen=True)
+class GameSnapshot:
+    """
+    Copy of the state of a game, taken between two turns.
+    The unit players are shared with the game, their own state is not captured.
+    """
+    world: WorldSnapshot
+    unit_players: Tuple[UnitPlayerBase, ...]
+    turn: int
+    game_over: bool
+    outcome: Optional[GameOutcome]
+    last_damage_turn: Optional[int]
+    last_action_turn: int
+    log_mark: Tuple[int, int]
+
+
 class WorldManager:
     """
     WorldManager is the main class that handles the world.
     It controls the creation of the world, the game loop, and the game logic.
+
+    Games end when a team has no units left or after config['max_turns'] turns.
+    Stalemates can also end them early, with these optional config keys:
+    - stalemate_turns: no unit was damaged during this many turns since
+      damage was last dealt. The window only starts with the first damage,
+      so that the armies have time to reach each other.
+    - idle_turns: no unit moved or was damaged during this many turns.
+    - repetitions: the state of the world, as given by its hash, was
+      repeated this many times since damage was last dealt.
+
+    With config['replay_file'], the game is recorded to a replay file (see
+    engine.replay) with a keyframe every config.get('keyframe_interval', 50)
+    turns. The path can contain {game}, the number of resets of the manager,
+    to record every game to its own file.
+
+    With config['profile'], a mode of engine.profiler or a Profiler, the
+    phases of every turn are timed and the profile of the last game is
+    kept in profile. With config['profile_file'] it is also written to that
+    file, whose path can contain the fields of engine.profiler.profile_path.
     """
 
     def __init__(self, map_file: str, unit_player_class_1: UnitPlayerBase, unit_player_class_2: UnitPlayerBase, config: dict):
         self.unit_player_class_1 = unit_player_class_1
         self.unit_player_class_2 = unit_player_class_2
         self.config = config
-        self.game_log = GameLog()
+        self.map_file = map_file
+        self.games_played = 0
+        self.replay_writer: Optional[ReplayWriter] = None
+        self.profile: Optional[GameProfile] = None
+        profiler = config.get('profile')
+        self.profiler: Optional[Profiler] = Profiler(profiler) if isinstance(profiler, str) else profiler
+        self.stalemate_turns: Optional[int] = config.get('stalemate_turns')
+        self.idle_turns: Optional[int] = config.get('idle_turns')
+        self.repetitions: Optional[int] = config.get('repetitions')
+        log_mode = config.get('log_mode', GameLogMode.FULL)
+        log_turns = config.get('log_turns')
+
+        if config.get('replay_file') and log_mode == GameLogMode.DISABLED:
+            # Replays are written from the log of the current turn.
+            log_mode, log_turns = GameLogMode.RING, 1
+
+        self.game_log = GameLog(log_mode, log_turns)
         self.init_world(map_file)
-        
+        self.open_replay()
+        self.start_profile()
+
     def init_world(self, map_file: str):
         """
         Initializes the world.
         """
-        self.units = []
-        self.unit_players = []
+        self.unit_players: Dict[int, UnitPlayerBase] = {}
+        self.alive_counts: Dict[Team, int] = {team: 0 for team in Team}
+        self.dead_units: List[Unit] = []
         self.turn = 0
         self.game_over = False
+        self.outcome: Optional[GameOutcome] = None
+        # Last turns at the end of which damage was dealt, None before
+        # the first damage, or a unit acted.
+        self.last_damage_turn: Optional[int] = None
+        self.last_action_turn = 0
+        # Number of times each world state was seen since damage was last dealt.
+        self.state_counts: Dict[int, int] = {}
         self.world = World(map_file, self)
+        self.initial_snapshot = self.snapshot()
+
+    def reset(self, unit_player_class_1: Optional[UnitPlayerBase] = None,
+              unit_player_class_2: Optional[UnitPlayerBase] = None):
+        """
+        Restores the initial state of the game in place, reusing the map and
+        the units, and creates new unit players for them.
+
+        Args:
+            unit_player_class_1: Optional new class for the first player's units.
+            unit_player_class_2: Optional new class for the second player's units.
+        """
+        if unit_player_class_1 is not None:
+            self.unit_player_class_1 = unit_player_class_1
+
+        if unit_player_class_2 is not None:
+            self.unit_player_class_2 = unit_player_class_2
+
+        self.close_replay()
+        self.restore(self.initial_snapshot)
+
+        for unit_id, unit_player in self.unit_players.items():
+            self.unit_players[unit_id] = self.create_unit_player(unit_player.uc)
+
+        self.games_played += 1
+        self.open_replay()
+        self.start_profile()
+
+    def open_replay(self):
+        """
+        Starts recording the game if the config has a replay file.
+        """
+        replay_file = self.config.get('replay_file')
+
+        if replay_file:
+            self.replay_writer = ReplayWriter(replay_file.format(game=self.games_played),
+                                              load_map_template(self.map_file),
+                                              self.config.get('keyframe_interval', 50))
 
-    def run_game(self, render_method: Any = None):
+    def close_replay(self):
+        """
+        Finishes the replay file of the game, if it is being recorded.
+        """
+        if self.replay_writer is not None:
+            self.replay_writer.close()
+            self.replay_writer = None
+
+    def start_profile(self):
+        """
+        Starts profiling the game if there is a profiler.
+        """
+        if self.profiler is not None:
+            self.profiler.start_game(self.map_file, brain_name(self.unit_player_class_1),
+                                     brain_name(self.unit_player_class_2))
+
+    def finish_profile(self):
+        """
+        Finishes the profile of the game and writes it to the profile file of the config.
+        """
+        if self.profiler is None or self.profiler.profile is None:
+            return
+
+        self.profile = self.profiler.end_game()
+        profile_file = self.config.get('profile_file')
+
+        if profile_file:
+            save_profile(self.profile, profile_path(profile_file, self.profile, self.games_played))
+
+    @property
+    def units(self) -> List[Unit]:
+        """
+        Returns the units that are alive, in the order they were added.
+        """
+        return [unit_player.uc.unit for unit_player in self.unit_players.values()
+                if unit_player.uc.unit.is_alive()]
+
+    def run_game(self, render_method: Any = None) -> Optional[Team]:
         """
         Runs the game.
+
+        Returns:
+            The winner, or None if there is none. How the game ended
+            is stored in outcome.
         """
         winner = None
 
         while not self.game_over and self.turn < self.config['max_turns']:
-            if render_method is not None:
-                render_method(self.world, self.game_log, self.turn)
+            winner = self.play_turn(render_method)
+
+        if self.outcome is None:
+            self.outcome = GameOutcome.DRAW
+
+        if winner is None:
+            logging.info('Draw!')
+
+        return winner
+
+    def play_turn(self, render_method: Any = None) -> Optional[Team]:
+        """
+        Plays a single turn.
+
+        Returns:
+            The winner if the game ended this turn, None otherwise.
+        """
+        winner = None
+        world = self.world
+        moves, damage_dealt = world.moves, world.damage_dealt
+        replay_writer = self.replay_writer
+        profiler = self.profiler
+
+        if render_method is not None:
+            render_method(self.world, self.game_log, self.turn)
+
+        if profiler is not None:
+            profiler.start_turn()
+            start = time.perf_counter_ns()
+
+        if replay_writer is not None and self.turn % replay_writer.keyframe_interval == 0:
+            replay_writer.write_keyframe(world, self.turn)
+
+        if profiler is not None:
+            profiler.record(None, 'replay', time.perf_counter_ns() - start)
+            self.run_units_profiled(profiler)
+            start = time.perf_counter_ns()
+        else:
+            # Units killed during the turn stay in the queue until the end
+            # of the turn so that the iteration is not disturbed.
+            for unit_player in self.unit_players.values():
+                unit = unit_player.uc.unit
+
+                if not unit.is_alive():
+                    continue
 
-            for unit_player in self.unit_players:
-                unit_player.uc.unit.start_turn()
+                unit.start_turn()
                 unit_player.run()
 
-            # If there are only units from one team left, the game is over.
-            if len(self.get_units_by_team(Team.RED)) == 0:
-                self.game_over = True
-                winner = Team.BLUE
-                logging.info('Blue team wins!')
-            elif len(self.get_units_by_team(Team.BLUE)) == 0:
-                self.game_over = True
-                winner = Team.RED
-                logging.info('Red team wins!')
+        self.remove_dead_units()
 
-            self.turn += 1
-            self.game_log.new_turn()
+        # If there are only units from one team left, the game is over.
+        if self.alive_counts[Team.RED] == 0:
+            self.game_over = True
+            self.outcome = GameOutcome.WIN
+            winner = Team.BLUE
+            logging.info('Blue team wins!')
+        elif self.alive_counts[Team.BLUE] == 0:
+            self.game_over = True
+            self.outcome = GameOutcome.WIN
+            winner = Team.RED
+            logging.info('Red team wins!')
 
-        if winner is None:
-            logging.info('Draw!')
+        if profiler is not None:
+            profiler.record(None, 'win_check', time.perf_counter_ns() - start)
+            start = time.perf_counter_ns()
+
+        if replay_writer is not None:
+            replay_writer.write_turn(self.turn, self.game_log.get_turn(self.turn))
+
+        self.turn += 1
+        self.game_log.new_turn()
+
+        if world.damage_dealt != damage_dealt:
+            self.last_damage_turn = self.last_action_turn = self.turn
+            self.state_counts.clear()
+        elif world.moves != moves:
+            self.last_action_turn = self.turn
+
+        if self.repetitions is not None:
+            self.state_counts[world.state_hash] = self.state_counts.get(world.state_hash, 0) + 1
+
+        if not self.game_over and self.is_stalemate():
+            self.game_over = True
+            self.outcome = GameOutcome.STALEMATE
+            logging.info('Stalemate!')
+
+        if profiler is not None:
+            profiler.record(None, 'stalemate_check', time.perf_counter_ns() - start)
+            profiler.end_turn()
+
+        if self.game_over or self.turn >= self.config['max_turns']:
+            self.close_replay()
+            self.finish_profile()
 
         return winner
 
+    def run_units_profiled(self, profiler: Profiler):
+        """
+        Runs the units of a turn like play_turn, timing their start_turn and run.
+        """
+        perf_counter_ns = time.perf_counter_ns
+
+        for unit_player in self.unit_players.values():
+            unit = unit_player.uc.unit
+
+            if not unit.is_alive():
+                continue
+
+            start = perf_counter_ns()
+            unit.start_turn()
+            middle = perf_counter_ns()
+            unit_player.run()
+            end = perf_counter_ns()
+            profiler.record(unit.team, 'start_turn', middle - start)
+            profiler.record(unit.team, 'run', end - middle)
+
+    def is_stalemate(self) -> bool:
+        """
+        Checks if no progress was made during the turns given by the config.
+        """
+        if (self.stalemate_turns is not None and self.last_damage_turn is not None
+                and self.turn - self.last_damage_turn >= self.stalemate_turns):
+            return True
+
+        if self.repetitions is not None and self.state_counts[self.world.state_hash] >= self.repetitions:
+            return True
+
+        return self.idle_turns is not None and self.turn - self.last_action_turn >= self.idle_turns
+
     def add_unit(self, unit: Unit, world: World):
         """
         Adds a unit to the unit queue.
         """
         world.add_unit(unit, unit.location)
-        self.units.append(unit)
-        unit_controller = UnitController(unit, world, self.game_log)
-
-        if unit.team == Team.RED:
-            upc = self.unit_player_class_1(unit_controller) 
+        if self.profiler is not None:
+            unit_controller = ProfiledUnitController(unit, world, self.game_log, self.profiler)
         else:
-            upc = self.unit_player_class_2(unit_controller)
+            unit_controller = UnitController(unit, world, self.game_log)
+
+        self.unit_players[unit.id] = self.create_unit_player(unit_controller)
+        self.alive_counts[unit.team] += 1
 
-        self.unit_players.append(upc)
+    def create_unit_player(self, unit_controller: UnitController) -> UnitPlayerBase:
+        """
+        Creates the unit player of a unit depending on its team.
+        """
+        if unit_controller.unit.team == Team.RED:
+            return self.unit_player_class_1(unit_controller)
+        else:
+            return self.unit_player_class_2(unit_controller)
 
     def remove_unit(self, unit: Unit):
         """
-        Removes a unit from the unit queue.
+        Removes a unit from the world and schedules its removal
+        from the unit queue at the end of the turn.
         """
-        index = self.units.index(unit)
-        self.units.pop(index)
-        self.unit_players.pop(index)
+        if unit.id not in self.unit_players or unit in self.dead_units:
+            return
+
         self.world.remove_unit(unit)
+        self.alive_counts[unit.team] -= 1
+        self.dead_units.append(unit)
+
+    def remove_dead_units(self):
+        """
+        Removes the units killed during the turn from the unit queue.
+        """
+        for unit in self.dead_units:
+            del self.unit_players[unit.id]
+
+        self.dead_units.clear()
+
+    def snapshot(self) -> GameSnapshot:
+        """
+        Captures the state of the game so that it can be restored later,
+        for instance to simulate several futures from the same turn.
+        """
+        unit_players = tuple(unit_player for unit_player in self.unit_players.values()
+                             if unit_player.uc.unit.is_alive())
+        return GameSnapshot(self.world.snapshot(), unit_players, self.turn,
+                            self.game_over, self.outcome, self.last_damage_turn,
+                            self.last_action_turn, self.game_log.mark())
+
+    def restore(self, snapshot: GameSnapshot):
+        """
+        Restores the game to the state captured by a snapshot.
+        """
+        self.world.restore(snapshot.world)
+
+        if self.replay_writer is not None:
+            self.replay_writer.truncate(snapshot.turn)
+
+        self.unit_players = {unit_player.uc.unit.id: unit_player
+                             for unit_player in snapshot.unit_players}
+        self.alive_counts = {team: 0 for team in Team}
+
+        for unit_player in snapshot.unit_players:
+            self.alive_counts[unit_player.uc.unit.team] += 1
+
+        self.dead_units.clear()
+        self.turn = snapshot.turn
+        self.game_over = snapshot.game_over
+        self.outcome = snapshot.outcome
+        self.last_damage_turn = snapshot.last_damage_turn
+        self.last_action_turn = snapshot.last_action_turn
+        self.state_counts.clear()
+        self.game_log.truncate(snapshot.log_mark)
 
     def get_units_by_team(self, team: Team) -> list:
         """
         Returns a list of units that are on the given team.
         """
-        return [unit for unit in self.units if unit.team == team]
\ No newline at end of file
+        return [unit for unit in self.units if unit.team == team]
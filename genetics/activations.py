@@ -12,4 +12,17 @@ def sigmoid(v):
     return 1 / (1+np.exp(-v))
 
 
-v_sigmoid = np.vectorize(sigmoid)
\ No newline at end of file
+v_sigmoid = np.vectorize(sigmoid)
+
+
+def sigmoid_(x: np.ndarray) -> np.ndarray:
+    """
+    Applies the sigmoid to an array in place.
+    """
+    with np.errstate(over='ignore'):
+        np.negative(x, out=x)
+        np.exp(x, out=x)
+
+    x += 1.0
+    np.reciprocal(x, out=x)
+    return x
@@ -0,0 +1,356 @@
+import multiprocessing
+import random
+
+import numpy as np
+
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from engine.team import Team
+from engine.unit_player import UnitPlayerBase
+from engine.world_manager import WorldManager
+from engine.game_log import GameLogMode
+
+from .fitness_cache import FitnessCache
+from .genetic_manager import GeneticManager
+from .net import Net
+
+
+class Evaluation:
+    """
+    State needed to evaluate individuals: a genetic manager whose
+    population is backed by the shared genome buffers, and a game
+    per map that is reset for every evaluation.
+    """
+
+    def __init__(self,
+                 genetic_manager: GeneticManager,
+                 genome_buffers: Tuple[np.ndarray, np.ndarray],
+                 map_files: List[str],
+                 unit_player_class_1: UnitPlayerBase,
+                 unit_player_class_2: UnitPlayerBase,
+                 max_turns: int,
+                 stalemate_turns: Optional[int] = None):
+        self.genetic_manager = genetic_manager
+        self.genome_buffers = genome_buffers
+        self.map_files = map_files
+        self.unit_player_classes = unit_player_class_1, unit_player_class_2
+        self.max_turns = max_turns
+        self.stalemate_turns = stalemate_turns
+        # Created on the first evaluation of each map, since the brains need a population.
+        self.world_managers: Dict[int, WorldManager] = {}
+        GeneticManager.set_instance(genetic_manager)
+
+    def evaluate(self, buffer_index: int, individual: int, map_index: int, seed: int,
+                 max_turns: Optional[int] = None) -> float:
+        """
+        Plays a game with an individual of the population and returns its fitness.
+        With max_turns, the game is stopped earlier than the usual maximum,
+        and the fitness is what the net earned in the turns played.
+        """
+        genetic_manager = self.genetic_manager
+        genomes = self.genome_buffers[buffer_index]
+
+        if genetic_manager.genomes is not genomes or not genetic_manager.population:
+            genetic_manager.use_genomes(genomes)
+
+        genetic_manager.iteration = individual
+        net = genetic_manager.get_current_net()
+        net.fitness = 0.0
+
+        world_manager = self.world_managers.get(map_index)
+
+        if world_manager is None:
+            world_manager = WorldManager(self.map_files[map_index], *self.unit_player_classes, {
+                "max_turns": self.max_turns,
+                "stalemate_turns": self.stalemate_turns,
+                "log_mode": GameLogMode.DISABLED,
+            })
+            self.world_managers[map_index] = world_manager
+        else:
+            world_manager.reset()
+
+        world_manager.config["max_turns"] = max_turns or self.max_turns
+        random.seed(seed)
+        winner = world_manager.run_game(None)
+
+        if winner == Team.BLUE:
+            net.fitness += (self.max_turns - world_manager.turn) * 2
+
+        return net.fitness
+
+
+# Evaluation state of the current worker process.
+_evaluation: Optional[Evaluation] = None
+_shared_memory: Optional[shared_memory.SharedMemory] = None
+
+
+def _init_worker(memory_name: str, shape: Tuple[int, int], genetic_params: dict,
+                 map_files: List[str], unit_player_class_1: UnitPlayerBase,
+                 unit_player_class_2: UnitPlayerBase, max_turns: int,
+                 stalemate_turns: Optional[int]):
+    global _evaluation, _shared_memory
+    _shared_memory = shared_memory.SharedMemory(name=memory_name)
+    genome_buffers = _genome_buffers(_shared_memory, shape)
+    genetic_manager = GeneticManager(**genetic_params, genome_buffers=genome_buffers)
+    _evaluation = Evaluation(genetic_manager, genome_buffers, map_files,
+                             unit_player_class_1, unit_player_class_2, max_turns, stalemate_turns)
+
+
+def _evaluate(job: Tuple[int, int, int, int, Optional[int]]) -> float:
+    return _evaluation.evaluate(*job)
+
+
+def _genome_buffers(memory: shared_memory.SharedMemory, shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    buffers = np.ndarray((2, *shape), dtype=np.float64, buffer=memory.buf)
+    return buffers[0], buffers[1]
+
+
+class ParallelEvaluator:
+    """
+    Evaluates the fitness of a whole population on a pool of worker processes.
+
+    Games are played on one map, or on any of a list of maps given by index.
+
+    The genomes of the genetic manager are stored in shared memory, so the
+    workers read them in place instead of receiving them pickled. Workers
+    are started once and keep their map and brain classes loaded. Every
+    game is reset and seeded on its own, so the fitness does not depend
+    on the number of workers. With num_workers=0 the games are played
+    in the current process.
+
+    If a fitness cache is given, individuals whose genome was already
+    evaluated on the same game are not played again. This is the case of
+    the survivors and clones of the best net that are carried unchanged
+    into the next generation.
+
+    With stalemate_turns, games where no damage is dealt during that many
+    turns after the first damage are stopped early (see WorldManager).
+    """
+
+    def __init__(self,
+                 population_size: int,
+                 mutation_rate: float,
+                 crossover_rate: float,
+                 net_params: dict,
+                 map_file: Union[str, Sequence[str]],
+                 unit_player_class_1: UnitPlayerBase,
+                 unit_player_class_2: UnitPlayerBase,
+                 max_turns: int,
+                 num_workers: int = 0,
+                 seed: Optional[int] = None,
+                 fitness_cache: Optional[FitnessCache] = None,
+                 stalemate_turns: Optional[int] = None):
+        genetic_params = {
+            'population_size': population_size,
+            'mutation_rate': mutation_rate,
+            'crossover_rate': crossover_rate,
+            'net_params': net_params,
+        }
+        shape = (population_size, Net.genome_size(**net_params))
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=2 * shape[0] * shape[1] * 8)
+        self.genome_buffers = _genome_buffers(self.shared_memory, shape)
+        self.genetic_manager = GeneticManager(**genetic_params, seed=seed, genome_buffers=self.genome_buffers)
+        self.num_workers = num_workers
+        self.map_files = [map_file] if isinstance(map_file, str) else list(map_file)
+        self.fitness_cache = fitness_cache
+        self.max_turns = max_turns
+        # Everything but the map and seed that the result of a game depends on.
+        self.opponent = (f"{_player_name(unit_player_class_1)} vs {_player_name(unit_player_class_2)}"
+                         f", {max_turns} turns, stalemate after {stalemate_turns}")
+        self.pool = None
+        self.evaluation = None
+
+        if num_workers > 0:
+            self.pool = multiprocessing.Pool(
+                num_workers, initializer=_init_worker,
+                initargs=(self.shared_memory.name, shape, genetic_params, self.map_files,
+                          unit_player_class_1, unit_player_class_2, max_turns, stalemate_turns))
+        else:
+            self.evaluation = Evaluation(self.genetic_manager, self.genome_buffers, self.map_files,
+                                         unit_player_class_1, unit_player_class_2, max_turns,
+                                         stalemate_turns)
+
+    def evaluate(self, seed: int) -> List[float]:
+        """
+        Plays a game with every individual of the population on the first map
+        using the same seed, and stores the results in the fitness of their nets.
+        """
+        games = [(individual, 0, seed) for individual in range(self.genetic_manager.population_size)]
+        fitness = self.play(games)
+
+        for net, value in zip(self.genetic_manager.population, fitness):
+            net.fitness = value
+
+        return fitness
+
+    def play(self, games: List[Tuple[int, int, int]], max_turns: Optional[int] = None) -> List[float]:
+        """
+        Plays games given as (individual, map index, seed) and returns their fitness.
+        With max_turns, the games are stopped after that many turns.
+        """
+        genetic_manager = self.genetic_manager
+        buffer_index = 0 if genetic_manager.genomes is self.genome_buffers[0] else 1
+        fitness: List[Optional[float]] = [None] * len(games)
+        keys = [None] * len(games)
+        jobs = []
+        pending = []
+        opponent = self.opponent if max_turns is None else f"{self.opponent}, stopped after {max_turns}"
+
+        for game, (individual, map_index, seed) in enumerate(games):
+            if self.fitness_cache is not None:
+                keys[game] = self.fitness_cache.key(genetic_manager.genomes[individual],
+                                                    self.map_files[map_index], opponent, seed)
+                fitness[game] = self.fitness_cache.get(keys[game])
+
+            if fitness[game] is None:
+                jobs.append((buffer_index, individual, map_index, seed, max_turns))
+                pending.append(game)
+
+        if self.pool is not None and jobs:
+            chunk_size = max(1, len(jobs) // (4 * self.num_workers))
+            results = self.pool.map(_evaluate, jobs, chunksize=chunk_size)
+        else:
+            results = [self.evaluation.evaluate(*job) for job in jobs]
+
+        for game, value in zip(pending, results):
+            fitness[game] = value
+
+            if self.fitness_cache is not None:
+                self.fitness_cache.put(keys[game], value)
+
+        return fitness
+
+    def __enter__(self) -> 'ParallelEvaluator':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(terminate=exc_type is not None)
+
+    def close(self, terminate: bool = False):
+        """
+        Stops the workers and releases the shared memory. The genomes
+        of the genetic manager are copied out of it first.
+
+        Args:
+            terminate: Stop the workers without waiting for their games,
+                for instance after an error or an interruption.
+        """
+        if self.genome_buffers is None:
+            return
+
+        if self.pool is not None:
+            if terminate:
+                self.pool.terminate()
+            else:
+                self.pool.close()
+
+            self.pool.join()
+            self.pool = None
+
+        genetic_manager = self.genetic_manager
+        genetic_manager.next_genomes = genetic_manager.next_genomes.copy()
+        genetic_manager.use_genomes(genetic_manager.genomes.copy())
+        self.genome_buffers = None
+        self.evaluation = None
+
+        try:
+            self.shared_memory.close()
+        except BufferError:
+            # Some views of the genomes are still alive, the memory is freed with them.
+            pass
+
+        self.shared_memory.unlink()
+
+        if self.fitness_cache is not None:
+            self.fitness_cache.save()
+
+
+def _player_name(unit_player_class: UnitPlayerBase) -> str:
+    return f"{unit_player_class.__module__}.{unit_player_class.__qualname__}"
+
+
+class RacingEvaluator(ParallelEvaluator):
+    """
+    Evaluates a population in rounds of games, dropping the worst
+    individuals after each round (successive halving).
+
+    Every individual plays the first round, and only the best keep_rate of
+    the remaining individuals play the next one. The games of a round can be
+    stopped early to make it cheaper: by default every individual plays one
+    game stopped at half the maximum number of turns, and the best tenth
+    plays two full games. A game stopped early scores what the net earned
+    in the turns played, and the win bonus only if it won by then.
+
+    The games of a generation are numbered, and game g is played on map
+    g % len(maps) with seed seed + g, so the individuals that play a round
+    all play the same games. The fitness of an individual is its mean
+    fitness over the games of the last round it played, so individuals are
+    only compared on games of the same length, and individuals dropped
+    earlier always rank below those that played more rounds.
+    """
+
+    def __init__(self, *args, rounds: Sequence[int] = (1, 2), keep_rate: float = 0.1,
+                 round_turns: Optional[Sequence[float]] = (0.5, 1.0), **kwargs):
+        """
+        Args:
+            rounds: The number of games played in each round.
+            keep_rate: The fraction of the individuals kept after each round.
+            round_turns: The fraction of the maximum number of turns the
+                games of each round last, or None for full games.
+        """
+        super().__init__(*args, **kwargs)
+        self.rounds = list(rounds)
+        self.keep_rate = keep_rate
+        self.round_turns = list(round_turns) if round_turns is not None else [1.0] * len(self.rounds)
+        self.games_played = 0
+        # Most turns the games of the last generation could last.
+        self.turns_budget = 0
+
+        if len(self.round_turns) != len(self.rounds):
+            raise ValueError("round_turns needs a fraction per round")
+
+    def evaluate(self, seed: int) -> List[float]:
+        """
+        Races the population, and stores the results in the fitness of their nets.
+        """
+        genetic_manager = self.genetic_manager
+        population_size = genetic_manager.population_size
+        rounds_played = np.zeros(population_size, dtype=np.int32)
+        fitness = np.zeros(population_size)
+        survivors = np.arange(population_size)
+        first_game = 0
+        self.games_played = 0
+        self.turns_budget = 0
+
+        for round_index, (games_in_round, turns) in enumerate(zip(self.rounds, self.round_turns)):
+            round_games = range(first_game, first_game + games_in_round)
+            games = [(individual, game % len(self.map_files), seed + game)
+                     for individual in survivors.tolist() for game in round_games]
+            max_turns = max(1, int(turns * self.max_turns))
+            results = self.play(games, max_turns if max_turns < self.max_turns else None)
+            results = np.array(results).reshape(len(survivors), games_in_round)
+            self.games_played += len(games)
+            self.turns_budget += len(games) * max_turns
+            first_game += games_in_round
+
+            fitness[survivors] = results.mean(axis=1)
+            rounds_played[survivors] += 1
+
+            if round_index + 1 < len(self.rounds):
+                keep = max(1, int(np.ceil(len(survivors) * self.keep_rate)))
+                order = np.argsort(-fitness[survivors], kind='stable')
+                survivors = np.sort(survivors[order[:keep]])
+
+        # Individuals dropped in a round are kept just below those that survived it.
+        floor = np.inf
+
+        for rounds in sorted(set(rounds_played.tolist()), reverse=True):
+            group = rounds_played == rounds
+            fitness[group] = np.minimum(fitness[group], floor)
+            floor = np.nextafter(fitness[group].min(), -np.inf)
+
+        for net, value in zip(genetic_manager.population, fitness.tolist()):
+            net.fitness = value
+
+        return fitness.tolist()
@@ -0,0 +1,96 @@
+import collections
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from typing import Optional, Tuple
+
+
+CacheKey = Tuple[str, str, str, int]
+
+
+def genome_hash(genome: np.ndarray) -> str:
+    """
+    Returns a hash of the content of a genome.
+    """
+    return hashlib.blake2b(np.ascontiguousarray(genome).tobytes(), digest_size=16).hexdigest()
+
+
+class FitnessCache:
+    """
+    Least recently used cache of the fitness of genomes.
+
+    Entries are keyed by the hash of the genome, the map, the opponent and
+    the seed of the game, since the same genome always gets the same fitness
+    when those do not change. If a path is given, the entries are loaded from
+    it and saved back to it by save, so they can be reused across runs.
+    The key does not cover the code of the brains and the rules, so a saved
+    cache must be discarded when they change.
+    """
+
+    def __init__(self, capacity: int = 10000, path: Optional[str] = None):
+        self.capacity = capacity
+        self.path = path
+        self.entries: 'collections.OrderedDict[CacheKey, float]' = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def key(genome: np.ndarray, map_file: str, opponent: str, seed: int) -> CacheKey:
+        return genome_hash(genome), map_file, opponent, seed
+
+    def get(self, key: CacheKey) -> Optional[float]:
+        """
+        Returns the fitness stored for a key, or None if it is not cached.
+        """
+        fitness = self.entries.get(key)
+
+        if fitness is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return fitness
+
+    def put(self, key: CacheKey, fitness: float):
+        """
+        Stores the fitness of a key, evicting the least recently used entries if needed.
+        """
+        self.entries[key] = fitness
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def load(self, path: str):
+        """
+        Adds the entries stored in a file, oldest first.
+        """
+        with open(path) as f:
+            for genome, map_file, opponent, seed, fitness in json.load(f):
+                self.put((genome, map_file, opponent, seed), fitness)
+
+    def save(self, path: Optional[str] = None):
+        """
+        Writes the entries to a file, by default the one the cache was loaded from.
+        """
+        path = path or self.path
+
+        if path is None:
+            return
+
+        temporary_path = f"{path}.tmp"
+
+        with open(temporary_path, 'w') as f:
+            json.dump([[*key, fitness] for key, fitness in self.entries.items()], f)
+
+        os.replace(temporary_path, path)
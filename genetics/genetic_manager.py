@@ -1,6 +1,6 @@
 import numpy as np
 
-from typing import Tuple
+from typing import List, Optional, Tuple
 from .net import Net
 
 
@@ -8,6 +8,11 @@ class GeneticManager:
     """
     Class that implements a genetic algorithm 
     and manages the current instances of the nets.
+
+    The genomes of the whole population are stored as the rows of a single
+    (population_size x genome_size) array, and the nets of the population
+    are views of those rows. Selection, crossover and mutation are applied
+    to the array as a whole.
     """
     instance: 'GeneticManager' = None
 
@@ -16,6 +21,8 @@ class GeneticManager:
                  mutation_rate: float,
                  crossover_rate: float,
                  net_params: dict,
+                 seed: Optional[int] = None,
+                 genome_buffers: Optional[Tuple[np.ndarray, np.ndarray]] = None,
                  ):
         """
         Initializes the genetic manager.
@@ -25,7 +32,13 @@ class GeneticManager:
         :param max_generations: The maximum number of generations.
         :param max_fitness: The maximum fitness.
         :param net_manager: The net manager.
+        :param seed: The seed of the random number generator.
+        :param genome_buffers: Two (population_size x genome_size) arrays to store
+            the genomes in, for instance in shared memory.
         """
+        if population_size < 2:
+            raise ValueError(f"The population needs at least 2 nets, got {population_size}")
+
         self.population_size = population_size
         self.population = []
         self.mutation_rate = mutation_rate
@@ -35,6 +48,15 @@ class GeneticManager:
         self.best_fitness = 0
         self.current_fitness = 0
         self.iteration = 0
+        self.rng = np.random.default_rng(seed)
+        self.genome_size = Net.genome_size(**net_params)
+
+        if genome_buffers is None:
+            genome_buffers = (np.zeros((population_size, self.genome_size)),
+                              np.zeros((population_size, self.genome_size)))
+
+        # The next generation is written into next_genomes before swapping it with genomes.
+        self.genomes, self.next_genomes = genome_buffers
 
     @classmethod
     def set_instance(cls, instance: 'GeneticManager'):
@@ -55,23 +77,35 @@ class GeneticManager:
         """
         Initializes the population.
         """
-        for _ in range(self.population_size):
-            self.population.append(Net(**self.net_params))
+        self.genomes[:] = np.clip(self.rng.standard_normal(self.genomes.shape), -1.0, 1.0)
+        self.population = self.nets_of(self.genomes)
+
+    def use_genomes(self, genomes: np.ndarray):
+        """
+        Makes the population views of the rows of a genome array.
+        """
+        self.genomes = genomes
+        self.population = self.nets_of(genomes)
+
+    def nets_of(self, genomes: np.ndarray) -> List[Net]:
+        """
+        Returns nets that are views of the rows of a genome array.
+        """
+        return [Net(**self.net_params, genome=genome) for genome in genomes]
+
+    def get_fitness(self) -> np.ndarray:
+        """
+        Returns the fitness of every net of the population.
+        """
+        return np.array([net.fitness for net in self.population], dtype=np.float64)
 
     def get_best_net(self) -> Tuple[int, Net]:
         """
         Returns the best net.
         :return: The best net and its index.
         """
-        best_net = self.population[0]
-        best_net_index = 0
-        
-        for i, net in enumerate(self.population):
-            if net.fitness > best_net.fitness:
-                best_net = net
-                best_net_index = i
-
-        return best_net_index, best_net
+        best_net_index = int(np.argmax(self.get_fitness()))
+        return best_net_index, self.population[best_net_index]
 
     def next_iteration(self):
         """
@@ -99,22 +133,19 @@ class GeneticManager:
         """
         Performs natural selection.
         """
-        self.population.sort(key=lambda net: net.fitness, reverse=True)
-
-        # best_net_array = best_net.to_array()
-        # best_net_array.dump('best_net.npy')
-        # best_net.save_to_file(f"best_net_{self.current_generation}.csv")
+        order = np.argsort(-self.get_fitness(), kind='stable')
+        best_net = self.population[order[0]]
 
         # Save the best net to a file.
-        self.population[0].save(f"models/best_net_{self.current_generation}.npy")
-        self.best_fitness = self.population[0].fitness
-
-        # Remove the worst 60% of the population.
-        self.population = [net.clone() for net in self.population[:int(self.population_size * 0.4)]]
+        best_net.save(f"models/best_net_{self.current_generation}.npy")
+        self.best_fitness = best_net.fitness
 
-        # Make 10% clones of the best net
-        for _ in range(self.population_size // 2 - len(self.population)):
-            self.population.append(self.population[0].clone())
+        # Keep the best 40% of the population and fill half of it with clones of the best net.
+        half = self.population_size // 2
+        parents = np.full(half, order[0])
+        survivors = min(int(self.population_size * 0.4), half)
+        parents[:survivors] = order[:survivors]
+        np.take(self.genomes, parents, axis=0, out=self.next_genomes[:half])
 
         # Add crossover of the best half of the population
         self.crossover()
@@ -122,23 +153,30 @@ class GeneticManager:
         # Mutate the population
         self.mutate()
 
+        self.genomes, self.next_genomes = self.next_genomes, self.genomes
+        self.population = self.nets_of(self.genomes)
 
     def crossover(self):
         """
-        Performs crossover.
+        Performs crossover. Every net of the second half of the next generation
+        is a crossover of a net of the first half with a random net of the first half.
         """
-        for i in range(self.population_size // 2):
-            net1 = self.population[i]
-            net2 = self.population[np.random.randint(self.population_size // 2)]
-            new_net = net1.crossover(net2, self.crossover_rate)
-            self.population.append(new_net)
+        half = self.population_size // 2
+        children = self.population_size - half
+        parents = self.next_genomes[np.arange(children) % half]
+        partners = self.next_genomes[self.rng.integers(half, size=children)]
+        genes = self.rng.random(parents.shape) < self.crossover_rate
+        np.copyto(parents, partners, where=genes)
+        self.next_genomes[half:] = parents
 
     def mutate(self):
         """
-        Performs mutation.
+        Performs mutation on the first half of the next generation, except the best net.
         """
-        for net in self.population[1:self.population_size // 2]:
-            net.mutate(self.mutation_rate)
+        genomes = self.next_genomes[1:self.population_size // 2]
+        genes = self.rng.random(genomes.shape) < self.mutation_rate
+        mutated = genomes[genes] + self.rng.standard_normal(np.count_nonzero(genes)) / 5.0
+        genomes[genes] = np.clip(mutated, -1.0, 1.0)
 
     def get_current_iteration_fitness(self) -> float:
         """
@@ -152,4 +190,4 @@ class GeneticManager:
         Returns the average fitness.
         :return: The average fitness.
         """
-        return sum(net.fitness for net in self.population) / self.population_size
\ No newline at end of file
+        return float(self.get_fitness().sum()) / self.population_size
\ No newline at end of file
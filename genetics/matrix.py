@@ -1,32 +1,36 @@
 import numpy as np
 
-from .activations import v_relu, v_sigmoid
+from typing import Optional
+
+from .activations import sigmoid_
+
+
+# Generator used when no explicit generator is given.
+default_rng = np.random.default_rng()
 
 
 class Matrix:
 
-    def __init__(self, rows, columns):
+    def __init__(self, rows, columns, buffer: Optional[np.ndarray] = None):
         self.rows = rows
         self.columns = columns
-        self.matrix = np.zeros((rows, columns))
+
+        if buffer is None:
+            self.matrix = np.zeros((rows, columns))
+        else:
+            # Share the memory of the buffer instead of allocating.
+            self.matrix = buffer.reshape(rows, columns)
 
     @staticmethod
     def from_1d_array(rows, columns, array) -> 'Matrix':
         m = Matrix(rows, columns)
-
-        for i in range(rows):
-            for j in range(columns):
-                m.matrix[i][j] = array[i*columns+j]
-
+        m.matrix = np.array(array[:rows*columns], dtype=np.float64).reshape(rows, columns)
         return m
 
     @staticmethod
     def column_matrix_from_array(array) -> 'Matrix':
         m = Matrix(len(array), 1)
-
-        for i in range(len(array)):
-            m.matrix[i][0] = array[i]
-
+        m.matrix = np.array(array, dtype=np.float64).reshape(-1, 1)
         return m
 
     def multiply_by_matrix(self, m) -> 'Matrix':
@@ -37,51 +41,33 @@ class Matrix:
         n.matrix = np.dot(self.matrix, m.matrix)
         return n
 
-    def randomize(self):
-        for i in range(self.rows):
-            for j in range(self.columns):
-                self.matrix[i][j] = np.random.normal()
-
-                if self.matrix[i][j] > 1.0:
-                    self.matrix[i][j] = 1.0
-                elif self.matrix[i][j] < -1.0:
-                    self.matrix[i][j] = -1.0
+    def randomize(self, rng: Optional[np.random.Generator] = None):
+        rng = rng or default_rng
+        self.matrix[:] = np.clip(rng.standard_normal((self.rows, self.columns)), -1.0, 1.0)
 
     def add_bias(self) -> 'Matrix':
         m = Matrix(self.rows+1, 1)
-
-        for i in range(self.rows):
-            m.matrix[i][0] = self.matrix[i][0]
-        
+        m.matrix[:self.rows] = self.matrix[:, :1]
         m.matrix[self.rows][0] = 1
-        self.rows += 1
         return m
 
     def activate(self) -> 'Matrix':
         m = Matrix(self.rows, self.columns)
-        m.matrix = v_sigmoid(self.matrix)
+        m.matrix = sigmoid_(self.matrix.copy())
         return m
 
-    def crossover(self, other, crossover_rate):
-        c = self.clone()
-
-        for i in range(self.rows):
-            for j in range(self.columns):
-                if np.random.random() < crossover_rate:
-                    c.matrix[i][j] = other.matrix[i][j]
-
+    def crossover(self, other, crossover_rate, rng: Optional[np.random.Generator] = None):
+        rng = rng or default_rng
+        c = Matrix(self.rows, self.columns)
+        genes = rng.random(self.matrix.shape) < crossover_rate
+        c.matrix = np.where(genes, other.matrix, self.matrix)
         return c
 
-    def mutate(self, mutation_rate):
-        for i in range(self.rows):
-            for j in range(self.columns):
-                if np.random.random() < mutation_rate:
-                    self.matrix[i][j] += np.random.normal() / 5.0
-
-                    if self.matrix[i][j] > 1.0:
-                        self.matrix[i][j] = 1.0
-                    elif self.matrix[i][j] < -1.0:
-                        self.matrix[i][j] = -1.0
+    def mutate(self, mutation_rate, rng: Optional[np.random.Generator] = None):
+        rng = rng or default_rng
+        genes = rng.random(self.matrix.shape) < mutation_rate
+        mutated = self.matrix[genes] + rng.standard_normal(np.count_nonzero(genes)) / 5.0
+        self.matrix[genes] = np.clip(mutated, -1.0, 1.0)
 
     def clone(self):
         c = Matrix(self.rows,self.columns)
@@ -89,13 +75,7 @@ class Matrix:
         return c
 
     def to_array(self):
-        arr = []
-
-        for i in range(self.rows):
-            for j in range(self.columns):
-                arr.append(self.matrix[i][j])
-                
-        return arr
+        return self.matrix.ravel().tolist()
     
     def print(self):
         for i in range(self.rows):
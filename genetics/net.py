@@ -1,75 +1,132 @@
 import numpy as np
 
-from .matrix import Matrix
+from typing import Optional, Tuple
+
+from .activations import sigmoid_
+from .matrix import Matrix, default_rng
 
 
 class Net:
+    """
+    Net with two hidden layers whose weights live in a single flat genome.
+
+    The weight matrices are views of the genome, so a Net built on a row of
+    a population array reads and writes that row directly.
+    """
 
-    def __init__(self, input_nodes, hidden_nodes, output_nodes):
+    def __init__(self, input_nodes, hidden_nodes, output_nodes, rng: Optional[np.random.Generator] = None,
+                 genome: Optional[np.ndarray] = None):
         self.input_nodes = input_nodes
         self.hidden_nodes = hidden_nodes
         self.output_nodes = output_nodes
 
-        self.ih_weights = Matrix(hidden_nodes, input_nodes+1)
-        self.hh_weights = Matrix(hidden_nodes, hidden_nodes+1)
-        self.ho_weights = Matrix(output_nodes, hidden_nodes+1)
+        randomize = genome is None
+
+        if genome is None:
+            genome = np.empty(Net.genome_size(input_nodes, hidden_nodes, output_nodes))
+
+        self.genome = genome
+        self.ih_weights, self.hh_weights, self.ho_weights = [
+            Matrix(rows, columns, genome[start:start + rows * columns])
+            for start, (rows, columns) in zip(
+                Net.layer_offsets(input_nodes, hidden_nodes, output_nodes),
+                Net.layer_shapes(input_nodes, hidden_nodes, output_nodes))]
 
-        self.ih_weights.randomize()
-        self.hh_weights.randomize()
-        self.ho_weights.randomize()
+        if randomize:
+            self.ih_weights.randomize(rng)
+            self.hh_weights.randomize(rng)
+            self.ho_weights.randomize(rng)
 
         self.fitness = 0.0
+        self._buffers: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+
+    @staticmethod
+    def layer_shapes(input_nodes, hidden_nodes, output_nodes):
+        return ((hidden_nodes, input_nodes+1),
+                (hidden_nodes, hidden_nodes+1),
+                (output_nodes, hidden_nodes+1))
+
+    @staticmethod
+    def layer_offsets(input_nodes, hidden_nodes, output_nodes):
+        sizes = [rows * columns for rows, columns in Net.layer_shapes(input_nodes, hidden_nodes, output_nodes)]
+        return [sum(sizes[:i]) for i in range(len(sizes))]
+
+    @staticmethod
+    def genome_size(input_nodes, hidden_nodes, output_nodes) -> int:
+        return sum(rows * columns for rows, columns in Net.layer_shapes(input_nodes, hidden_nodes, output_nodes))
 
     def load(self, file_path):
         weights = np.load(file_path, allow_pickle=True)
-        self.ih_weights.matrix = weights[0]
-        self.hh_weights.matrix = weights[1]
-        self.ho_weights.matrix = weights[2]
+        self.ih_weights.matrix[:] = weights[0]
+        self.hh_weights.matrix[:] = weights[1]
+        self.ho_weights.matrix[:] = weights[2]
 
     def save(self, file_path):
-        np.save(file_path, [self.ih_weights.matrix,
-                self.hh_weights.matrix, self.ho_weights.matrix])
+        weights = np.empty(3, dtype=object)
+
+        for i, matrix in enumerate([self.ih_weights, self.hh_weights, self.ho_weights]):
+            weights[i] = matrix.matrix.copy()
+
+        np.save(file_path, weights)
 
     def forward(self, inputs):
-        X = Matrix.column_matrix_from_array(inputs)
-        X = X.add_bias()
+        return self.forward_batch(np.asarray(inputs, dtype=np.float64)[np.newaxis])[0].tolist()
+
+    def forward_batch(self, inputs: np.ndarray) -> np.ndarray:
+        """
+        Runs the net on a (batch x input_nodes) array.
+
+        Returns:
+            A (batch x output_nodes) array. It is a buffer of the net that
+            is overwritten by the next call, so copy it to keep it.
+        """
+        batch = len(inputs)
+        hidden_1, hidden_2, outputs = self.buffers(batch)
 
         # Calculate the first layer
-        X = self.ih_weights.multiply_by_matrix(X)
-        X = X.activate()
-        X = X.add_bias()
+        weights = self.ih_weights.matrix
+        np.matmul(inputs, weights[:, :-1].T, out=hidden_1)
+        hidden_1 += weights[:, -1]
+        sigmoid_(hidden_1)
 
         # Calculate the second layer
-        X = self.hh_weights.multiply_by_matrix(X)
-        X = X.activate()
-        X = X.add_bias()
+        weights = self.hh_weights.matrix
+        np.matmul(hidden_1, weights[:, :-1].T, out=hidden_2)
+        hidden_2 += weights[:, -1]
+        sigmoid_(hidden_2)
 
         # Calculate the outputs
-        X = self.ho_weights.multiply_by_matrix(X)
-
-        return X.to_array()
-
-    def mutate(self, mutation_rate):
-        self.ih_weights.mutate(mutation_rate)
-        self.hh_weights.mutate(mutation_rate)
-        self.ho_weights.mutate(mutation_rate)
-
-    def crossover(self, other, crossover_rate):
-        c = Net(self.input_nodes, self.hidden_nodes, self.output_nodes)
-        c.ih_weights = self.ih_weights.crossover(
-            other.ih_weights, crossover_rate)
-        c.hh_weights = self.hh_weights.crossover(
-            other.hh_weights, crossover_rate)
-        c.ho_weights = self.ho_weights.crossover(
-            other.ho_weights, crossover_rate)
-        return c
+        weights = self.ho_weights.matrix
+        np.matmul(hidden_2, weights[:, :-1].T, out=outputs)
+        outputs += weights[:, -1]
+
+        return outputs
+
+    def buffers(self, batch: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the layer buffers for a batch, growing them if needed.
+        """
+        if self._buffers is None or len(self._buffers[0]) < batch:
+            self._buffers = (np.empty((batch, self.hidden_nodes)),
+                             np.empty((batch, self.hidden_nodes)),
+                             np.empty((batch, self.output_nodes)))
+
+        return tuple(buffer[:batch] for buffer in self._buffers)
+
+    def mutate(self, mutation_rate, rng: Optional[np.random.Generator] = None):
+        self.ih_weights.mutate(mutation_rate, rng)
+        self.hh_weights.mutate(mutation_rate, rng)
+        self.ho_weights.mutate(mutation_rate, rng)
+
+    def crossover(self, other, crossover_rate, rng: Optional[np.random.Generator] = None):
+        rng = rng or default_rng
+        genes = rng.random(self.genome.shape) < crossover_rate
+        return Net(self.input_nodes, self.hidden_nodes, self.output_nodes,
+                   genome=np.where(genes, other.genome, self.genome))
 
     def clone(self):
-        c = Net(self.input_nodes, self.hidden_nodes, self.output_nodes)
-        c.ih_weights = self.ih_weights.clone()
-        c.hh_weights = self.hh_weights.clone()
-        c.ho_weights = self.ho_weights.clone()
-        return c
+        return Net(self.input_nodes, self.hidden_nodes, self.output_nodes,
+                   genome=self.genome.copy())
 
 
 if __name__ == "__main__":
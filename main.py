@@ -1,37 +1,49 @@
 import argparse
+import glob
+import importlib
 import logging
-import pygame
+import os
+import re
+import subprocess
 import sys
-import math
-import random
 
-from engine.game_log import GameActionType, GameLog
-from engine.location import Location
-from engine.team import Team
-from engine.world import World
-from engine.unit_player import UnitPlayerBase
+from typing import Dict, List, Tuple
 
-from engine.world_manager import WorldManager
-from reinforcement.genetic_manager import GeneticManager
+# Subsystems are imported by the commands that use them, so that headless
+# commands start without loading pygame or the genetics stack.
 
 
-BLACK = (0, 0, 0)
-WHITE = (200, 200, 200)
-RED = (225, 22, 22)
-BLUE = (22, 22, 225)
-GREEN = (22, 225, 22)
 RENDER_SPEED = 8
-INFOBAR_HEIGHT = 80
 
 
 POPULATION_SIZE = 100
 
 
+COMMANDS = ["run", "train", "tournament", "league", "replay", "imports"]
+
+# Modules each command imports, used by the import time report.
+COMMAND_IMPORTS: Dict[str, Tuple[str, ...]] = {
+    "run": ("brains", "engine.world_manager"),
+    "run --render": ("brains", "engine.world_manager", "renderer"),
+    "train": ("brains", "genetics.evaluator", "genetics.fitness_cache"),
+    "tournament": ("tournament.runner",),
+    "league": ("tournament.league",),
+    "replay": ("renderer",),
+}
+
+# Modules that headless commands should not need.
+HEAVY_MODULES = ("pygame", "torch", "genetics")
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="""
         This is a simple script to run the main program.
         """)
+    parser.add_argument("command", nargs="?", choices=COMMANDS, default=None,
+                        help="The command to run. By default it is chosen from the options below.")
     parser.add_argument("-m", "--map", type=str, default="maps/medium.txt",
                         help="The map file to load.")
     parser.add_argument("-upc1", "--unit_player_class_1", type=str,
@@ -42,83 +54,45 @@ def parse_args() -> argparse.Namespace:
                         help="The seed to use for the random number generator.")
     parser.add_argument("-r", "--render", action="store_true", default=True,
                         help="Render the game.")
+    parser.add_argument("--headless", action="store_false", dest="render",
+                        help="Play the game without opening a window.")
     parser.add_argument("-t", "--train", action="store_true", default=True,
                         help="Train the neural network.")
+    parser.add_argument("-sp", "--speed", type=float, default=RENDER_SPEED,
+                        help="The number of turns shown per second when rendering.")
+    parser.add_argument("--fps", type=int, default=30,
+                        help="The frame rate of the window when rendering.")
+    parser.add_argument("-rec", "--record", type=str, default=None,
+                        help="Record the game to this replay file.")
+    parser.add_argument("-rp", "--replay", type=str, default=None,
+                        help="Watch a recorded replay file.")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="The number of processes used to evaluate the population when training.")
+    parser.add_argument("-T", "--tournament", action="store_true", default=False,
+                        help="Play every pair of brains on every map and store the results.")
+    parser.add_argument("-L", "--league", type=int, default=0,
+                        help="Play this many rated league games between the brains and saved nets.")
+    parser.add_argument("-n", "--num_seeds", type=int, default=3,
+                        help="The number of seeds each tournament pairing is played with.")
+    parser.add_argument("-db", "--results", type=str, default="tournament.sqlite",
+                        help="The SQLite file where tournament and league results are stored.")
+    parser.add_argument("-p", "--profile", type=str, default=None,
+                        choices=["counters", "cprofile", "tracemalloc"],
+                        help="Time the phases of every game played by the run, tournament and league commands.")
+    parser.add_argument("-pf", "--profile_file", type=str, default="profiles/{red}-{blue}-{map}-{pid}-{game}.json",
+                        help="The file where the profile of every game is written.")
+    parser.add_argument("-fc", "--fitness_cache", type=str, default=None,
+                        help="The file where the fitness of evaluated genomes is kept between runs. "
+                             "Delete it after changing the rules or the brains.")
     return parser.parse_args()
 
 
-def draw_arrow(screen, color, start, end):
-    pygame.draw.line(screen, color, start, end, 3)
-    rotation = math.degrees(math.atan2(start[1]-end[1], end[0]-start[0]))+90
-    pygame.draw.polygon(screen, color, ((end[0]+4*math.sin(math.radians(rotation)), end[1]+4*math.cos(math.radians(rotation))), (end[0]+4*math.sin(math.radians(
-        rotation-120)), end[1]+4*math.cos(math.radians(rotation-120))), (end[0]+4*math.sin(math.radians(rotation+120)), end[1]+4*math.cos(math.radians(rotation+120)))))
-
-
-def draw_ui(turn: int) -> None:
-    # Fill the last 80 pixels with black
-    # pygame.draw.rect(SCREEN, BLACK, (0, WINDOW_HEIGHT - INFOBAR_HEIGHT, WINDOW_WIDTH, INFOBAR_HEIGHT))
-    font = pygame.font.SysFont(None, 32)
-    img = font.render(f'TURN {turn}', True, WHITE)
-    SCREEN.blit(img, (20, WINDOW_HEIGHT - INFOBAR_HEIGHT + 20))
-
-
-def draw_map(world: World) -> None:
-    for x in range(0, WINDOW_WIDTH, BLOCK_SIZE):
-        for y in range(0, WINDOW_HEIGHT - INFOBAR_HEIGHT, BLOCK_SIZE):
-            rect = pygame.Rect(x, y, BLOCK_SIZE, BLOCK_SIZE)
-            loc = Location(x // BLOCK_SIZE, y // BLOCK_SIZE)
-
-            if world.has_obstacle(loc):
-                pygame.draw.rect(SCREEN, BLACK, rect)
-            elif world.is_occupied(loc):
-                if world.get_unit_at_location(loc).team == Team.RED:
-                    pygame.draw.rect(SCREEN, RED, rect)
-                elif world.get_unit_at_location(loc).team == Team.BLUE:
-                    pygame.draw.rect(SCREEN, BLUE, rect)
-                else:
-                    pygame.draw.rect(SCREEN, GREEN, rect)
-            else:
-                pygame.draw.rect(SCREEN, WHITE, rect)
-
-
-def draw_debug(game_log: GameLog, turn: int) -> None:
-    for action in game_log.actions[turn-1]:
-        subject_center = (action.subject_location.x * BLOCK_SIZE + BLOCK_SIZE // 2,
-                          action.subject_location.y * BLOCK_SIZE + BLOCK_SIZE // 2)
-        target_center = (action.target_location.x * BLOCK_SIZE + BLOCK_SIZE // 2,
-                         action.target_location.y * BLOCK_SIZE + BLOCK_SIZE // 2)
-
-        if action.action_type == GameActionType.MOVE:
-            color = GREEN
-        elif action.action_type == GameActionType.ATTACK:
-            color = RED
-        elif action.action_type == GameActionType.HEAL:
-            color = BLUE
-        else:
-            color = WHITE
-
-        # Draw an arrow from the subject to the target
-        # pygame.draw.line(SCREEN, color, subject_center, target_center, 5)
-        draw_arrow(SCREEN, color, subject_center, target_center)
-
-
-def render_screen(world: World, game_log: GameLog, turn: int) -> None:
-    SCREEN.fill(BLACK)
-    draw_map(world)
-    draw_ui(turn)
-    draw_debug(game_log, turn)
-
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-
-    pygame.display.update()
-    CLOCK.tick(RENDER_SPEED)
-
-
-def train(args: argparse.Namespace, unit_player_class_1: UnitPlayerBase, unit_player_class_2: UnitPlayerBase):
-    genetic_manager = GeneticManager(
+def train(args: argparse.Namespace):
+    from brains import load_unit_player_class
+    from genetics.evaluator import RacingEvaluator
+    from genetics.fitness_cache import FitnessCache
+
+    evaluator = RacingEvaluator(
         population_size=POPULATION_SIZE,
         mutation_rate=0.05,
         crossover_rate=0.1,
@@ -126,72 +100,182 @@ def train(args: argparse.Namespace, unit_player_class_1: UnitPlayerBase, unit_pl
             'input_nodes': 118,
             'hidden_nodes': 16,
             'output_nodes': 9,
-        }
+        },
+        map_file=args.map,
+        unit_player_class_1=load_unit_player_class(args.unit_player_class_1),
+        unit_player_class_2=load_unit_player_class(args.unit_player_class_2),
+        max_turns=100,
+        num_workers=args.workers,
+        seed=args.seed,
+        fitness_cache=FitnessCache(path=args.fitness_cache),
     )
+    genetic_manager = evaluator.genetic_manager
     genetic_manager.initialize_population()
-    GeneticManager.set_instance(genetic_manager)
 
-    for generation in range(100):
-        for i in range(POPULATION_SIZE):
-            logging.info(f'Generation {generation+1} - {i+1}/{POPULATION_SIZE}')
-            game_manager = WorldManager(args.map, unit_player_class_1, unit_player_class_2, {
-                "max_turns": 100,
+    # The evaluator releases its workers and shared memory even if training is interrupted.
+    with evaluator:
+        for generation in range(100):
+            logging.info(f'Generation {generation+1} - evaluating {POPULATION_SIZE} individuals')
+            evaluator.evaluate(seed=42)
+            logging.info(f"Played {evaluator.games_played} games of at most {evaluator.turns_budget} turns in total")
+            logging.info(f"Fitness cache: {evaluator.fitness_cache.hits} hits, {evaluator.fitness_cache.misses} misses")
+
+            genetic_manager.new_generation()
+            logging.info(f"Average fitness of generation {generation+1}: {genetic_manager.current_fitness}")
+            logging.info(f"Best fitness of generation {generation+1}: {genetic_manager.best_fitness}")
+
+
+def render_game(args: argparse.Namespace):
+    from brains import load_unit_player_class
+    from engine.world_manager import WorldManager
+
+    unit_player_class_1 = load_unit_player_class(args.unit_player_class_1)
+    unit_player_class_2 = load_unit_player_class(args.unit_player_class_2)
+    game_manager = WorldManager(args.map, unit_player_class_1, unit_player_class_2, {
+                "max_turns": 2000,
+                "replay_file": args.record,
+                **profile_config(args),
             })
 
-            random.seed(42)
+    if args.render:
+        from renderer import Renderer, ThreadedPlayback
 
-            winner = game_manager.run_game(None)
+        renderer = Renderer(game_manager.world.obstacle_map)
+        ThreadedPlayback(game_manager, renderer, speed=args.speed, fps=args.fps).run()
+    else:
+        winner = game_manager.run_game(None)
+        logging.info(f"{game_manager.outcome.name} after {game_manager.turn} turns, winner: {winner}")
 
-            if winner == Team.BLUE:
-                genetic_manager.get_current_net().fitness += (100-game_manager.turn) * 2
 
-            # logging.info(f"Sample fitness: {genetic_manager.get_current_iteration_fitness()}")
-            genetic_manager.next_iteration()
+def replay(args: argparse.Namespace):
+    from renderer import ReplayViewer
 
-        genetic_manager.new_generation()
-        logging.info(f"Average fitness of generation {generation+1}: {genetic_manager.current_fitness}")
-        logging.info(f"Best fitness of generation {generation+1}: {genetic_manager.best_fitness}")
+    ReplayViewer(args.replay, speed=args.speed, fps=args.fps).run()
 
 
-def render_game(args: argparse.Namespace, unit_player_class_1: UnitPlayerBase, unit_player_class_2: UnitPlayerBase):
-    global SCREEN, CLOCK, WINDOW_HEIGHT, WINDOW_WIDTH, BLOCK_SIZE
+def tournament(args: argparse.Namespace):
+    from tournament.runner import run_tournament
 
-    render_method = None
-    game_manager = WorldManager(args.map, unit_player_class_1, unit_player_class_2, {
-                "max_turns": 2000,
-            })
+    runner = run_tournament(args.results, num_seeds=args.num_seeds, num_workers=args.workers,
+                            config={"max_turns": 500, "stalemate_turns": 100, **profile_config(args)})
 
-    if args.render:
-        BLOCK_SIZE = 20
-        WINDOW_WIDTH = BLOCK_SIZE * game_manager.world.width
-        WINDOW_HEIGHT = BLOCK_SIZE * game_manager.world.height + INFOBAR_HEIGHT
+    for standing in runner.standings():
+        logging.info(f"{standing.brain}: {standing.wins} wins, {standing.draws} draws, "
+                     f"{standing.losses} losses in {standing.games} games")
 
-        pygame.init()
-        SCREEN = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-        CLOCK = pygame.time.Clock()
-        SCREEN.fill(BLACK)
-        render_method = render_screen
+    runner.store.close()
 
-    game_manager.run_game(render_method)
 
+def league(args: argparse.Namespace):
+    from tournament.league import run_league
 
-def load_unit_player_class(name: str) -> UnitPlayerBase:
-    upc = f"brains.{name}.unit_player.UnitPlayer"
-    upc = getattr(__import__(upc.rsplit(".", 1)[0], fromlist=[
-                                upc.rsplit(".", 1)[1]]), upc.rsplit(".", 1)[1])
-    return upc
+    league = run_league(args.results, args.league, num_workers=args.workers, seed=args.seed,
+                        config={"max_turns": 500, "stalemate_turns": 100, **profile_config(args)})
 
+    for player, rating in league.standings():
+        logging.info(f"{player}: {rating.rating:.0f} ± {2 * rating.deviation:.0f} after {rating.games} games")
 
-def main(args: argparse.Namespace) -> None:
-    logging.basicConfig(level=logging.INFO)
+    league.store.close()
 
-    unit_player_class_1 = load_unit_player_class(args.unit_player_class_1)
-    unit_player_class_2 = load_unit_player_class(args.unit_player_class_2)
 
-    if args.train:
-        train(args, unit_player_class_1, unit_player_class_2)
-    else:
-        render_game(args, unit_player_class_1, unit_player_class_2)
+def profile_config(args: argparse.Namespace) -> dict:
+    """
+    Returns the WorldManager config that profiles the games, if asked to.
+    """
+    if not args.profile:
+        return {}
+
+    return {"profile": args.profile, "profile_file": args.profile_file}
+
+
+def profile_report(args: argparse.Namespace):
+    """
+    Logs the phases of the profiled games summed by brain, including the
+    games of earlier runs written to the same files.
+    """
+    from engine.profiler import aggregate_profiles, format_phases, load_profile
+
+    paths = sorted(glob.glob(re.sub(r"\{\w+\}", "*", args.profile_file)))
+    logging.info(f"Profile of {len(paths)} games:")
+
+    for line in format_phases(aggregate_profiles(map(load_profile, paths))):
+        logging.info(line)
+
+
+def import_command(command: str):
+    """
+    Imports the modules a command needs.
+    """
+    for module in COMMAND_IMPORTS[command]:
+        importlib.import_module(module)
+
+
+def measure_imports(command: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Imports the modules of a command in a new interpreter with -X importtime.
+
+    Returns:
+        A (module, self us, cumulative us, depth) tuple per imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import main; main.import_command({command!r})"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return [(match[4], int(match[1]), int(match[2]), len(match[3]) // 2)
+            for match in map(IMPORT_TIME_LINE.match, result.stderr.splitlines()) if match]
+
+
+def import_report(args: argparse.Namespace):
+    """
+    Logs the startup import time of every command, the heavy modules it
+    loads and its slowest top level imports.
+    """
+    for command in COMMAND_IMPORTS:
+        modules = measure_imports(command)
+        total = sum(self_time for _, self_time, _, _ in modules)
+        heavy = sorted({name.split(".")[0] for name, _, _, _ in modules} & set(HEAVY_MODULES))
+        slowest = sorted((module for module in modules if module[3] == 0), key=lambda module: -module[2])[:5]
+
+        logging.info(f"{command}: {total / 1000:.0f} ms, {len(modules)} modules, "
+                     f"heavy: {', '.join(heavy) or 'none'}")
+        logging.info("  slowest: " + ", ".join(f"{name} {cumulative / 1000:.0f} ms"
+                                               for name, _, cumulative, _ in slowest))
+
+
+def get_command(args: argparse.Namespace) -> str:
+    if args.command is not None:
+        return args.command
+
+    if args.replay:
+        return "replay"
+
+    if args.tournament:
+        return "tournament"
+
+    if args.league:
+        return "league"
+
+    return "train" if args.train else "run"
+
+
+def main(args: argparse.Namespace) -> None:
+    logging.basicConfig(level=logging.INFO)
+    command = get_command(args)
+
+    if command == "replay" and not args.replay:
+        logging.error("The replay command needs a replay file, use --replay")
+        return
+
+    {
+        "run": render_game,
+        "train": train,
+        "tournament": tournament,
+        "league": league,
+        "replay": replay,
+        "imports": import_report,
+    }[command](args)
+
+    if args.profile and command in ("run", "tournament", "league"):
+        profile_report(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,429 @@
+import math
+import queue
+import sys
+import threading
+
+import numpy as np
+import pygame
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from engine.game_log import GameActionType, GameLog, GameLogMode
+from engine.replay import ReplayReader, ReplayState
+from engine.team import Team
+from engine.world import World
+from engine.world_manager import WorldManager
+
+
+BLACK = (0, 0, 0)
+WHITE = (200, 200, 200)
+RED = (225, 22, 22)
+BLUE = (22, 22, 225)
+GREEN = (22, 225, 22)
+INFOBAR_HEIGHT = 80
+MAX_WINDOW_SIZE = 1000
+
+ACTION_COLORS = {
+    GameActionType.MOVE.value: GREEN,
+    GameActionType.ATTACK.value: RED,
+    GameActionType.HEAL.value: BLUE,
+}
+
+
+def draw_arrow(screen, color, start, end):
+    pygame.draw.line(screen, color, start, end, 3)
+    rotation = math.degrees(math.atan2(start[1]-end[1], end[0]-start[0]))+90
+    pygame.draw.polygon(screen, color, ((end[0]+4*math.sin(math.radians(rotation)), end[1]+4*math.cos(math.radians(rotation))), (end[0]+4*math.sin(math.radians(
+        rotation-120)), end[1]+4*math.cos(math.radians(rotation-120))), (end[0]+4*math.sin(math.radians(rotation+120)), end[1]+4*math.cos(math.radians(rotation+120)))))
+
+
+TEAM_COLORS = {
+    Team.RED.value: RED,
+    Team.BLUE.value: BLUE,
+    Team.NEUTRAL.value: GREEN,
+}
+
+
+def cell_colors(obstacle_map: np.ndarray, team_map: np.ndarray) -> np.ndarray:
+    """
+    Returns the color of every cell of a map, as a (width x height x 3) array.
+    """
+    colors = np.empty((*team_map.shape, 3), dtype=np.uint8)
+    colors[:] = WHITE
+
+    for team, color in TEAM_COLORS.items():
+        colors[team_map == team] = color
+
+    colors[obstacle_map] = BLACK
+    return colors
+
+
+@dataclass(frozen=True)
+class Frame:
+    """
+    What the renderer needs to draw a turn, copied from the game
+    so that the simulation can go on while it is drawn.
+    """
+    turn: int
+    team_map: np.ndarray
+    actions: Dict[str, np.ndarray]
+    logged: bool
+
+    @staticmethod
+    def capture(world: World, game_log: GameLog, turn: int) -> 'Frame':
+        actions = {name: column.copy() for name, column in game_log.get_turn(turn - 1).items()}
+        return Frame(turn, world.team_map.copy(), actions, game_log.mode != GameLogMode.DISABLED)
+
+
+class Renderer:
+    """
+    Draws a game in a pygame window, only redrawing what changed.
+
+    The cells are kept in an off-screen map surface. Between two frames only
+    the cells touched by the actions of the last turn can change, so only
+    those are repainted from the world arrays, and only the areas under the
+    last and new action arrows are copied to the screen and updated.
+    The whole map is repainted with surfarray on the first frame, when the
+    game log is disabled or when turns were skipped.
+    """
+
+    def __init__(self, obstacle_map: np.ndarray, block_size: Optional[int] = None, speed: int = 8):
+        width, height = obstacle_map.shape
+
+        if block_size is None:
+            block_size = max(1, min(20, MAX_WINDOW_SIZE // max(width, height)))
+
+        self.block_size = block_size
+        self.speed = speed
+        self.obstacle_map = obstacle_map
+        self.map_width = block_size * width
+        self.map_height = block_size * height
+
+        pygame.init()
+        self.screen = pygame.display.set_mode((self.map_width, self.map_height + INFOBAR_HEIGHT))
+        self.clock = pygame.time.Clock()
+        self.font = pygame.font.SysFont(None, 32)
+        self.map_surface = pygame.Surface((self.map_width, self.map_height))
+        self.infobar = pygame.Rect(0, self.map_height, self.map_width, INFOBAR_HEIGHT)
+        self.last_turn: Optional[int] = None
+        # Areas of the screen covered by the arrows of the last frame.
+        self.arrow_rects_drawn: List[pygame.Rect] = []
+        self.screen.fill(BLACK)
+
+    def __call__(self, world: World, game_log: GameLog, turn: int):
+        """
+        Draws a frame, it can be used as the render method of a WorldManager.
+        """
+        self.draw(world, game_log, turn)
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+
+        self.clock.tick(self.speed)
+
+    def draw(self, world: World, game_log: GameLog, turn: int):
+        self.draw_state(world.team_map, game_log.get_turn(turn - 1), turn,
+                        game_log.mode != GameLogMode.DISABLED)
+
+    def draw_state(self, team_map: np.ndarray, actions: Dict[str, np.ndarray], turn: int,
+                   logged: bool = True):
+        """
+        Draws the map with the given team map, and the arrows of the
+        actions that led to it from the previous turn.
+
+        Args:
+            logged: False if the actions are not known, to repaint the whole map.
+        """
+        full = self.last_turn is None or turn != self.last_turn + 1 or not logged
+        self.last_turn = turn
+        arrow_rects = self.arrow_rects(actions)
+
+        if full:
+            self.draw_map(team_map)
+            self.screen.blit(self.map_surface, (0, 0))
+        else:
+            self.draw_cells(team_map, actions)
+
+            # Erase the arrows of the last frame and copy the repainted cells,
+            # which are under the new arrows.
+            for rect in self.arrow_rects_drawn + arrow_rects:
+                self.screen.blit(self.map_surface, rect, rect)
+
+        self.draw_arrows(actions)
+        self.draw_ui(turn)
+
+        if full:
+            pygame.display.update()
+        else:
+            pygame.display.update(self.arrow_rects_drawn + arrow_rects + [self.infobar])
+
+        self.arrow_rects_drawn = arrow_rects
+
+    def draw_map(self, team_map: np.ndarray):
+        """
+        Paints every cell of the map surface.
+        """
+        cells = pygame.surfarray.make_surface(cell_colors(self.obstacle_map, team_map))
+        pygame.transform.scale(cells, (self.map_width, self.map_height), self.map_surface)
+
+    def draw_cells(self, team_map: np.ndarray, actions: Dict[str, np.ndarray]):
+        """
+        Repaints the cells at both ends of the actions of a turn.
+        """
+        width, height = team_map.shape
+        xs = np.concatenate([actions['subject_x'], actions['target_x']])
+        ys = np.concatenate([actions['subject_y'], actions['target_y']])
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        block_size = self.block_size
+
+        for x, y in set(zip(xs[inside].tolist(), ys[inside].tolist())):
+            if self.obstacle_map[x, y]:
+                color = BLACK
+            else:
+                color = TEAM_COLORS.get(int(team_map[x, y]), WHITE)
+
+            self.map_surface.fill(color, (x * block_size, y * block_size, block_size, block_size))
+
+    def arrow_rects(self, actions: Dict[str, np.ndarray]) -> List[pygame.Rect]:
+        """
+        Returns the rectangles covered by the arrows of some actions,
+        which include the cells at both of their ends.
+        """
+        block_size = self.block_size
+        screen_rect = self.screen.get_rect()
+        rects = []
+
+        for subject_x, subject_y, target_x, target_y in zip(
+                actions['subject_x'].tolist(), actions['subject_y'].tolist(),
+                actions['target_x'].tolist(), actions['target_y'].tolist()):
+            rect = pygame.Rect(min(subject_x, target_x) * block_size, min(subject_y, target_y) * block_size,
+                               (abs(subject_x - target_x) + 1) * block_size,
+                               (abs(subject_y - target_y) + 1) * block_size)
+            # Room for the width of the line and the head of the arrow.
+            rects.append(rect.inflate(12, 12).clip(screen_rect))
+
+        return rects
+
+    def draw_arrows(self, actions: Dict[str, np.ndarray]):
+        """
+        Draws an arrow from the subject to the target of every action.
+        """
+        block_size = self.block_size
+        half = block_size // 2
+
+        for action_type, subject_x, subject_y, target_x, target_y in zip(
+                actions['action_type'].tolist(), actions['subject_x'].tolist(), actions['subject_y'].tolist(),
+                actions['target_x'].tolist(), actions['target_y'].tolist()):
+            subject_center = (subject_x * block_size + half, subject_y * block_size + half)
+            target_center = (target_x * block_size + half, target_y * block_size + half)
+            draw_arrow(self.screen, ACTION_COLORS.get(action_type, WHITE), subject_center, target_center)
+
+    def draw_ui(self, turn: int):
+        self.screen.fill(BLACK, self.infobar)
+        img = self.font.render(f'TURN {turn}', True, WHITE)
+        self.screen.blit(img, (20, self.map_height + 20))
+
+    def draw_frame(self, frame: Frame):
+        self.draw_state(frame.team_map, frame.actions, frame.turn, frame.logged)
+
+
+class SimulationStopped(Exception):
+    """Raised in the simulation thread when the playback is closed."""
+
+
+class ThreadedPlayback:
+    """
+    Runs a game on a simulation thread at full speed while the main thread
+    draws it, so that the simulation is not throttled by the rendering.
+
+    The simulation publishes a Frame per turn into a bounded queue, and waits
+    when it is full. Every tick of the render loop takes the frames due at
+    the playback speed, skipping all but the last one when the speed is
+    higher than the frame rate. Controls:
+    - Space: pause or resume.
+    - Right / Left: double or halve the playback speed.
+    - F: fast-forward, drawing the latest turn simulated.
+    """
+
+    def __init__(self, world_manager: WorldManager, renderer: Renderer,
+                 speed: float = 8, fps: int = 30, queue_size: int = 256):
+        self.world_manager = world_manager
+        self.renderer = renderer
+        self.speed = speed
+        self.fps = fps
+        self.frames: 'queue.Queue[Optional[Frame]]' = queue.Queue(queue_size)
+        self.stopped = threading.Event()
+        self.paused = False
+        self.fast_forward = False
+
+    def publish(self, world: World, game_log: GameLog, turn: int):
+        """
+        Render method of the simulated game, queues a frame of the turn.
+        """
+        self.put(Frame.capture(world, game_log, turn))
+
+    def put(self, frame: Optional[Frame]):
+        while True:
+            if self.stopped.is_set():
+                raise SimulationStopped()
+
+            try:
+                self.frames.put(frame, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def simulate(self):
+        try:
+            self.world_manager.run_game(self.publish)
+            # The render method is called before each turn, add the final state.
+            world_manager = self.world_manager
+            self.publish(world_manager.world, world_manager.game_log, world_manager.turn)
+            self.put(None)
+        except SimulationStopped:
+            pass
+
+    def run(self):
+        """
+        Plays the game until it ends or the window is closed.
+        """
+        thread = threading.Thread(target=self.simulate, daemon=True)
+        thread.start()
+        clock = pygame.time.Clock()
+        # Turns due to be shown at the playback speed.
+        due = 0.0
+        finished = False
+
+        try:
+            while not finished:
+                if not self.handle_events():
+                    break
+
+                if self.paused:
+                    count = 0
+                elif self.fast_forward:
+                    count = self.frames.qsize()
+                else:
+                    due += self.speed / self.fps
+                    count = int(due)
+
+                frame = None
+                taken = 0
+
+                while taken < count:
+                    try:
+                        next_frame = self.frames.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    taken += 1
+
+                    if next_frame is None:
+                        finished = True
+                        break
+
+                    frame = next_frame
+
+                # Do not catch up in a burst after waiting for the simulation.
+                due = min(due - taken, 1.0)
+
+                if frame is not None:
+                    self.renderer.draw_frame(frame)
+
+                clock.tick(self.fps)
+        finally:
+            self.stopped.set()
+            thread.join()
+            pygame.quit()
+
+    def handle_events(self) -> bool:
+        """
+        Handles the events of the window.
+
+        Returns:
+            False if the window was closed.
+        """
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return False
+
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    self.paused = not self.paused
+                elif event.key == pygame.K_RIGHT:
+                    self.speed *= 2
+                elif event.key == pygame.K_LEFT:
+                    self.speed = max(1, self.speed / 2)
+                elif event.key == pygame.K_f:
+                    self.fast_forward = not self.fast_forward
+
+        return True
+
+
+class ReplayViewer:
+    """
+    Plays a replay file in a window. Controls:
+    - Space: pause or resume.
+    - Right / Left: step a turn forward or back.
+    - Up / Down: jump a keyframe interval forward or back.
+    - Home / End: go to the first or last turn.
+    """
+
+    def __init__(self, path: str, speed: float = 8, fps: int = 30):
+        self.replay = ReplayReader(path)
+        self.renderer = Renderer(self.replay.obstacle_map)
+        self.speed = speed
+        self.fps = fps
+        self.paused = False
+        self.state: Optional[ReplayState] = None
+
+    def seek(self, turn: int):
+        turn = min(max(turn, 0), self.replay.num_turns)
+
+        if self.state is not None and turn == self.state.turn + 1:
+            self.replay.apply_turn(self.state, self.replay.get_actions(self.state.turn))
+        elif self.state is None or turn != self.state.turn:
+            self.state = self.replay.get_state(turn)
+        else:
+            return
+
+        actions = self.replay.get_actions(turn - 1) if turn > 0 else self.replay.empty_actions()
+        self.renderer.draw_state(self.replay.team_map(self.state), actions, turn)
+
+    def run(self):
+        clock = pygame.time.Clock()
+        due = 0.0
+        self.seek(0)
+
+        while True:
+            turn = self.state.turn
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    self.replay.close()
+                    return
+
+                if event.type == pygame.KEYDOWN:
+                    turn = {
+                        pygame.K_RIGHT: turn + 1,
+                        pygame.K_LEFT: turn - 1,
+                        pygame.K_UP: turn + self.replay.keyframe_interval,
+                        pygame.K_DOWN: turn - self.replay.keyframe_interval,
+                        pygame.K_HOME: 0,
+                        pygame.K_END: self.replay.num_turns,
+                    }.get(event.key, turn)
+
+                    if event.key == pygame.K_SPACE:
+                        self.paused = not self.paused
+
+            if not self.paused and turn < self.replay.num_turns:
+                due += self.speed / self.fps
+                turn += int(due)
+                due -= int(due)
+
+            self.seek(turn)
+            clock.tick(self.fps)
@@ -0,0 +1,245 @@
+import glob
+import logging
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from brains import list_brains
+
+from .result_store import GameResult, ResultStore
+from .runner import GameWorker, _init_worker, _play, game_digest
+
+
+# Scale of the Glicko rating system.
+Q = math.log(10) / 400
+INITIAL_RATING = 1500.0
+INITIAL_DEVIATION = 350.0
+MIN_DEVIATION = 30.0
+
+
+@dataclass
+class Rating:
+    """
+    Glicko rating of a player: its estimated strength and the
+    standard deviation of that estimate.
+    """
+    rating: float = INITIAL_RATING
+    deviation: float = INITIAL_DEVIATION
+    games: int = 0
+
+    @property
+    def conservative(self) -> float:
+        """
+        A rating the player is very likely above, used to rank players.
+        """
+        return self.rating - 2 * self.deviation
+
+
+def glicko_g(deviation: float) -> float:
+    return 1 / math.sqrt(1 + 3 * Q ** 2 * deviation ** 2 / math.pi ** 2)
+
+
+def expected_score(player: Rating, opponent: Rating) -> float:
+    """
+    Returns the expected score of a player against an opponent.
+    """
+    return 1 / (1 + 10 ** (-glicko_g(opponent.deviation) * (player.rating - opponent.rating) / 400))
+
+
+def update_rating(player: Rating, opponent: Rating, score: float):
+    """
+    Updates the rating of a player after a game with a score of
+    1 for a win, 0.5 for a draw and 0 for a loss.
+    The rating of the opponent should be the one it had before the game.
+    """
+    g = glicko_g(opponent.deviation)
+    expected = expected_score(player, opponent)
+    inverse_variance = 1 / player.deviation ** 2 + Q ** 2 * g ** 2 * expected * (1 - expected)
+    player.rating += Q / inverse_variance * g * (score - expected)
+    player.deviation = max(MIN_DEVIATION, math.sqrt(1 / inverse_variance))
+    player.games += 1
+
+
+def pairing_information(ratings: Sequence[Rating]) -> np.ndarray:
+    """
+    Returns how much a game between each pair of players is expected to
+    teach about their ratings: the most for close ratings and uncertain
+    players. The diagonal is zero.
+    """
+    rating = np.array([r.rating for r in ratings])
+    variance = np.array([r.deviation for r in ratings]) ** 2
+    combined_variance = variance[:, np.newaxis] + variance
+    g = 1 / np.sqrt(1 + 3 * Q ** 2 * combined_variance / np.pi ** 2)
+    expected = 1 / (1 + 10 ** (-g * (rating[:, np.newaxis] - rating) / 400))
+    information = expected * (1 - expected) * g ** 2 * combined_variance
+    np.fill_diagonal(information, 0.0)
+    return information
+
+
+class Matchmaker:
+    """
+    Chooses the most informative pairings for the next games.
+    """
+
+    def __init__(self, rng: np.random.Generator):
+        self.rng = rng
+
+    def pairings(self, ratings: Sequence[Rating], count: int) -> List[Tuple[int, int]]:
+        """
+        Returns count pairs of player indices, in a random order of sides.
+        Players are only repeated in a batch once every player has a game.
+        """
+        information = np.triu(pairing_information(ratings))
+        firsts, seconds = np.unravel_index(np.argsort(-information, axis=None), information.shape)
+        pairs = []
+        busy = set()
+
+        for first, second in zip(firsts.tolist(), seconds.tolist()):
+            if len(pairs) == count or information[first, second] <= 0:
+                break
+
+            if first in busy or second in busy:
+                continue
+
+            pairs.append((first, second))
+            busy.update((first, second))
+
+        if pairs and len(pairs) < count:
+            # Not enough free players, repeat the best pairings.
+            pairs = [pairs[i % len(pairs)] for i in range(count)]
+
+        return [(first, second) if self.rng.random() < 0.5 else (second, first)
+                for first, second in pairs]
+
+
+class League:
+    """
+    Rates players by playing games chosen by a Matchmaker instead of every
+    pairing, updating their ratings after every game.
+
+    Players are brains.load_player specs. Games are played on worker
+    processes in batches and stored in a ResultStore; the ratings are
+    replayed from the stored games of the players when the league is
+    created, so a league continues across runs. Only the games played
+    with the same config and player files count.
+    """
+
+    def __init__(self, players: Sequence[str], maps: Sequence[str], store: ResultStore,
+                 config: dict, num_workers: int = 0, seed: Optional[int] = None):
+        self.players = list(players)
+        self.maps = list(maps)
+        self.store = store
+        self.config = config
+        self.num_workers = num_workers
+        self.rng = np.random.default_rng(seed)
+        self.matchmaker = Matchmaker(self.rng)
+        self.ratings: Dict[str, Rating] = {player: Rating() for player in self.players}
+
+        digests: Dict[Tuple[str, str], str] = {}
+
+        for result in store.results():
+            if result.red not in self.ratings or result.blue not in self.ratings:
+                continue
+
+            pair = result.red, result.blue
+
+            if pair not in digests:
+                digests[pair] = game_digest(config, *pair)
+
+            if result.config == digests[pair]:
+                self.add_result(result)
+
+    def add_result(self, result: GameResult):
+        """
+        Updates the ratings of the players of a game.
+        """
+        red, blue = self.ratings[result.red], self.ratings[result.blue]
+        red_before = Rating(red.rating, red.deviation, red.games)
+
+        if result.winner is None:
+            score = 0.5
+        else:
+            score = 1.0 if result.winner == result.red else 0.0
+
+        update_rating(red, blue, score)
+        update_rating(blue, red_before, 1.0 - score)
+
+    def schedule(self, count: int) -> List[Tuple[str, str, str, int]]:
+        """
+        Returns the next count games as (red, blue, map, seed) jobs.
+        """
+        ratings = [self.ratings[player] for player in self.players]
+        return [(self.players[red], self.players[blue],
+                 self.maps[self.rng.integers(len(self.maps))], int(self.rng.integers(2 ** 31)))
+                for red, blue in self.matchmaker.pairings(ratings, count)]
+
+    def run(self, num_games: int, batch_size: Optional[int] = None):
+        """
+        Plays num_games games, scheduling batch_size of them at a time
+        with the ratings known so far.
+        """
+        batch_size = batch_size or max(1, 2 * self.num_workers)
+        pool = None
+
+        if self.num_workers > 0:
+            pool = multiprocessing.Pool(self.num_workers, initializer=_init_worker,
+                                        initargs=(self.config,))
+        else:
+            worker = GameWorker(self.config)
+
+        try:
+            played = 0
+
+            while played < num_games:
+                jobs = self.schedule(min(batch_size, num_games - played))
+
+                if not jobs:
+                    break
+
+                results = pool.imap_unordered(_play, jobs) if pool is not None else map(worker.play, jobs)
+
+                for result in results:
+                    self.store.add(result, commit=False)
+                    self.add_result(result)
+
+                self.store.commit()
+                played += len(jobs)
+                logging.info(f"League: played {played}/{num_games} games")
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def standings(self) -> List[Tuple[str, Rating]]:
+        """
+        Returns the players and their ratings, best first.
+        """
+        return sorted(self.ratings.items(), key=lambda item: -item[1].conservative)
+
+
+def default_players() -> List[str]:
+    """
+    Returns every brain in brains/ and every net saved in models/ as a player of the brain brain.
+    """
+    nets = sorted(glob.glob(os.path.join("models", "best_net_*.npy")),
+                  key=lambda path: int(path.rsplit("_", 1)[1].split(".")[0]))
+    return list_brains() + [f"brain:{net}" for net in nets]
+
+
+def run_league(results_file: str, num_games: int, players: Optional[Sequence[str]] = None,
+               maps: Optional[Sequence[str]] = None, config: Optional[dict] = None,
+               num_workers: int = 0, seed: Optional[int] = None) -> League:
+    """
+    Plays num_games league games between the players, all the brains and
+    saved nets by default, on the maps, all those in maps/ by default.
+    """
+    maps = list(maps or sorted(glob.glob(os.path.join("maps", "*.txt"))))
+    league = League(players or default_players(), maps, ResultStore(results_file),
+                    config or {"max_turns": 500}, num_workers, seed)
+    league.run(num_games)
+    return league
@@ -0,0 +1,150 @@
+import sqlite3
+
+from dataclasses import astuple, dataclass, fields
+from typing import Collection, List, Optional, Set, Tuple
+
+
+JobKey = Tuple[str, str, str, int]
+# A job and the digest of the config it was played with.
+ResultKey = Tuple[str, str, str, int, str]
+
+
+@dataclass(frozen=True)
+class GameResult:
+    """
+    Result of a tournament game between the red and blue brains.
+    winner is the name of the winning brain, or None for draws and stalemates.
+    config is the digest of the game config and of the files of the brains
+    (see runner.game_digest), so that games played differently are not mixed.
+    """
+    red: str
+    blue: str
+    map_file: str
+    seed: int
+    winner: Optional[str]
+    outcome: str
+    turns: int
+    red_units: int
+    blue_units: int
+    duration: float
+    config: str
+
+    @property
+    def key(self) -> ResultKey:
+        return self.red, self.blue, self.map_file, self.seed, self.config
+
+
+@dataclass(frozen=True)
+class Standing:
+    """
+    Results of a brain over all its games.
+    """
+    brain: str
+    games: int
+    wins: int
+    draws: int
+    losses: int
+
+
+COLUMNS = [field.name for field in fields(GameResult)]
+
+
+class ResultStore:
+    """
+    SQLite database of tournament results, with one row per game indexed
+    by the brains, the map, the seed and the config digest.
+    """
+
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                red TEXT NOT NULL,
+                blue TEXT NOT NULL,
+                map_file TEXT NOT NULL,
+                seed INTEGER NOT NULL,
+                winner TEXT,
+                outcome TEXT NOT NULL,
+                turns INTEGER NOT NULL,
+                red_units INTEGER NOT NULL,
+                blue_units INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                config TEXT NOT NULL,
+                PRIMARY KEY (red, blue, map_file, seed, config)
+            );
+        """)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(results)")]
+
+        if columns != COLUMNS:
+            self.connection.close()
+            raise ValueError(f"{path} was written by another version of the tournament, "
+                             f"use a new results file")
+
+        self.connection.executescript("""
+            CREATE INDEX IF NOT EXISTS results_blue ON results (blue);
+            CREATE INDEX IF NOT EXISTS results_map ON results (map_file);
+        """)
+
+    def completed(self) -> Set[ResultKey]:
+        """
+        Returns the keys of the games already stored, with their config digest.
+        """
+        return set(self.connection.execute("SELECT red, blue, map_file, seed, config FROM results"))
+
+    def add(self, result: GameResult, commit: bool = True):
+        """
+        Stores the result of a game, replacing any previous result of the same game.
+        """
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO results ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))})", astuple(result))
+
+        if commit:
+            self.connection.commit()
+
+    def commit(self):
+        self.connection.commit()
+
+    def results(self, brain: Optional[str] = None, map_file: Optional[str] = None) -> List[GameResult]:
+        """
+        Returns the stored results in the order they were added,
+        optionally only those of a brain or a map.
+        """
+        query = f"SELECT {', '.join(COLUMNS)} FROM results WHERE 1"
+        params = []
+
+        if brain is not None:
+            query += " AND (red = ? OR blue = ?)"
+            params += [brain, brain]
+
+        if map_file is not None:
+            query += " AND map_file = ?"
+            params.append(map_file)
+
+        query += " ORDER BY rowid"
+        return [GameResult(*row) for row in self.connection.execute(query, params)]
+
+    def standings(self, configs: Optional[Collection[str]] = None) -> List[Standing]:
+        """
+        Returns the wins, draws and losses of every brain, best first,
+        optionally only over the games played with some config digests.
+        """
+        results = "results"
+        params = []
+
+        if configs is not None:
+            params = list(configs)
+            results = f"(SELECT * FROM results WHERE config IN ({', '.join('?' * len(params))}))"
+
+        rows = self.connection.execute(f"""
+            SELECT brain, COUNT(*), SUM(winner = brain), SUM(winner IS NULL), SUM(winner != brain)
+            FROM (SELECT red AS brain, winner FROM {results}
+                  UNION ALL SELECT blue AS brain, winner FROM {results})
+            GROUP BY brain
+        """, params + params)
+        standings = [Standing(*row) for row in rows]
+        standings.sort(key=lambda standing: (-standing.wins, standing.losses, standing.brain))
+        return standings
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,210 @@
+import collections
+import functools
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import time
+
+import numpy as np
+
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from brains import BRAINS_DIR, list_brains, load_player, load_unit_player_class
+from engine.game_log import GameLogMode
+from engine.team import Team
+from engine.world_manager import WorldManager
+
+from .result_store import GameResult, JobKey, ResultStore, Standing
+
+
+GameKey = Tuple[str, str, str]
+
+# Config keys that do not change the result of a game.
+UNSCORED_CONFIG_KEYS = ('log_mode', 'log_turns', 'replay_file', 'keyframe_interval',
+                        'profile', 'profile_file')
+
+
+@functools.lru_cache(maxsize=None)
+def player_digest(spec: str) -> str:
+    """
+    Returns a digest of the files a player given as a brains.load_player
+    spec is made of: the sources of its brain and its net file, if any.
+    """
+    name, _, net_file = spec.partition(":")
+    net_file = net_file or getattr(load_unit_player_class(name), "NET_FILE", None)
+    brain_dir = os.path.join(BRAINS_DIR, name)
+    paths = sorted(os.path.relpath(path, BRAINS_DIR)
+                   for path in glob.glob(os.path.join(brain_dir, "**", "*.py"), recursive=True))
+    digest = hashlib.blake2b(digest_size=16)
+
+    for path in paths:
+        digest.update(path.encode())
+
+        with open(os.path.join(BRAINS_DIR, path), "rb") as f:
+            digest.update(f.read())
+
+    if net_file and os.path.exists(net_file):
+        with open(net_file, "rb") as f:
+            digest.update(f.read())
+
+    return digest.hexdigest()
+
+
+def game_digest(config: dict, red: str, blue: str) -> str:
+    """
+    Returns a digest of everything but the map and seed that the result of
+    a game depends on: the game config and the files of the two players.
+    """
+    scored_config = {key: value for key, value in config.items() if key not in UNSCORED_CONFIG_KEYS}
+    description = json.dumps([scored_config, player_digest(red), player_digest(blue)],
+                             sort_keys=True, default=str)
+    return hashlib.blake2b(description.encode(), digest_size=16).hexdigest()
+
+
+def expand_jobs(brains: Sequence[str], maps: Sequence[str], seeds: Sequence[int]) -> List[JobKey]:
+    """
+    Returns a (red, blue, map, seed) job for every ordered pair of different
+    brains, every map and every seed.
+    """
+    return [(red, blue, map_file, seed)
+            for red, blue in itertools.permutations(brains, 2)
+            for map_file in maps
+            for seed in seeds]
+
+
+class GameWorker:
+    """
+    Plays tournament games between players given as brains.load_player
+    specs, keeping the games of the last few pairings and maps so that
+    later jobs only reset them instead of loading the map and brains again.
+    """
+
+    def __init__(self, config: dict, capacity: int = 4):
+        self.config = {**config, "log_mode": GameLogMode.DISABLED}
+        self.capacity = capacity
+        # Games by (red, blue, map_file), the least recently played first.
+        self.world_managers: 'collections.OrderedDict[GameKey, WorldManager]' = collections.OrderedDict()
+
+    def play(self, job: JobKey) -> GameResult:
+        red, blue, map_file, seed = job
+        start = time.perf_counter()
+        world_manager = self.world_managers.get((red, blue, map_file))
+        random.seed(seed)
+        np.random.seed(seed)
+
+        if world_manager is None:
+            world_manager = WorldManager(map_file, load_player(red), load_player(blue), self.config)
+            self.world_managers[(red, blue, map_file)] = world_manager
+
+            if len(self.world_managers) > self.capacity:
+                self.world_managers.popitem(last=False)
+        else:
+            self.world_managers.move_to_end((red, blue, map_file))
+            world_manager.reset()
+
+        winner = world_manager.run_game(None)
+        winner_name = {Team.RED: red, Team.BLUE: blue}.get(winner)
+
+        return GameResult(red, blue, map_file, seed, winner_name, world_manager.outcome.name,
+                          world_manager.turn, world_manager.alive_counts[Team.RED],
+                          world_manager.alive_counts[Team.BLUE], time.perf_counter() - start,
+                          game_digest(self.config, red, blue))
+
+
+# Game worker of the current worker process.
+_worker: Optional[GameWorker] = None
+
+
+def _init_worker(config: dict):
+    global _worker
+    logging.getLogger().setLevel(logging.WARNING)
+    _worker = GameWorker(config)
+
+
+def _play(job: JobKey) -> GameResult:
+    return _worker.play(job)
+
+
+class TournamentRunner:
+    """
+    Runs the games of a tournament on a pool of worker processes and
+    stores their results as they finish.
+
+    Games already in the result store with the same config and player
+    files are skipped, so an interrupted tournament continues where it
+    stopped when it is run again.
+    """
+
+    def __init__(self, store: ResultStore, config: dict, num_workers: int = 0):
+        self.store = store
+        self.config = config
+        self.num_workers = num_workers
+        # Config digests of the games of the last run.
+        self.configs: Set[str] = set()
+
+    def run(self, jobs: Sequence[JobKey]) -> int:
+        """
+        Plays the jobs that are not stored yet.
+
+        Returns:
+            The number of games played.
+        """
+        completed = self.store.completed()
+        digests = {(red, blue): game_digest(self.config, red, blue)
+                   for red, blue in {job[:2] for job in jobs}}
+        self.configs = set(digests.values())
+        pending = [job for job in jobs if (*job, digests[job[:2]]) not in completed]
+        logging.info(f"Tournament: {len(jobs) - len(pending)} games done, {len(pending)} to play")
+
+        for played, result in enumerate(self.play(pending), 1):
+            self.store.add(result)
+
+            if played % 100 == 0:
+                logging.info(f"Tournament: played {played}/{len(pending)} games")
+
+        return len(pending)
+
+    def standings(self) -> List[Standing]:
+        """
+        Returns the standings over the stored games played like those of the last run.
+        """
+        return self.store.standings(self.configs)
+
+    def play(self, jobs: List[JobKey]) -> Iterator[GameResult]:
+        if not jobs:
+            return
+
+        if self.num_workers == 0:
+            worker = GameWorker(self.config)
+            yield from map(worker.play, jobs)
+            return
+
+        # Jobs of a pairing and map go to the same chunk so the workers reuse their games.
+        chunk_size = max(1, len(jobs) // (4 * self.num_workers))
+
+        with multiprocessing.Pool(self.num_workers, initializer=_init_worker,
+                                  initargs=(self.config,)) as pool:
+            yield from pool.imap_unordered(_play, jobs, chunksize=chunk_size)
+
+
+def run_tournament(results_file: str, brains: Optional[Sequence[str]] = None,
+                   maps: Optional[Sequence[str]] = None, num_seeds: int = 1,
+                   config: Optional[dict] = None, num_workers: int = 0) -> TournamentRunner:
+    """
+    Plays every pair of brains on every map with num_seeds seeds.
+    By default all the brains in brains/ and all the maps in maps/ are used.
+
+    Returns:
+        The runner, with the store of the results.
+    """
+    brains = list(brains or list_brains())
+    maps = list(maps or sorted(glob.glob(os.path.join("maps", "*.txt"))))
+    store = ResultStore(results_file)
+    runner = TournamentRunner(store, config or {"max_turns": 500}, num_workers)
+    runner.run(expand_jobs(brains, maps, range(num_seeds)))
+    return runner